@@ -1,35 +1,192 @@
-import multiprocessing  # Biblioteca para crear y manejar procesos independientes
+import json  # Archivo de estado de los servicios
 import os  # Biblioteca para interactuar con el sistema operativo
+import signal  # Parada ordenada con SIGTERM o Ctrl+C
+import subprocess  # web.py y caja.py como procesos hijos directos
+import sys  # Intérprete con el que se lanzan los hijos
+import time  # Esperas, plazos y espera exponencial entre reinicios
+import urllib.request  # Comprobación de salud del servidor web
+import latido  # Latidos que escriben los procesos supervisados
 
-# Función para ejecutar el servidor Flask
-def run_web():
-    # Usa un comando del sistema operativo para ejecutar el archivo "web.py"
-    os.system("python3 web.py")
+# Supervisor de la caja: lanza web.py y caja.py como hijos directos (sin
+# intérpretes intermedios), comprueba su salud y los reinicia con espera
+# exponencial si terminan o dejan de responder.
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+ESTADO = os.getenv("ESTADO_SUPERVISOR", os.path.join(latido.DIRECTORIO, "estado.json"))  # Estado de los servicios en JSON
+INTERVALO = 1.0  # Segundos entre comprobaciones
+PLAZO_ARRANQUE = float(os.getenv("PLAZO_ARRANQUE", "60"))  # Margen para el primer latido tras arrancar
+PLAZO_PARADA = 10  # Segundos para terminar antes de matar el proceso
+ESPERA_MAXIMA = 60  # Espera máxima entre reinicios
+ESTABLE = 120  # Segundos sano tras los que se olvidan los fallos anteriores
+NUM_NUCLEOS = os.cpu_count() or 1
 
-# Función para ejecutar el reconocimiento facial
-def run_caja():
-    # Usa un comando del sistema operativo para ejecutar el archivo "caja.py"
-    os.system("python3 caja.py")
 
-if __name__ == "__main__":
-    # Bloque principal del script, asegura que el código dentro de este bloque
-    # solo se ejecute cuando el archivo se ejecuta directamente, no cuando es importado.
+def leer_nucleos(texto, por_defecto):
+    """
+    Convierte "1,2,3" en {1, 2, 3}. Vacío o "-" significa sin afinidad (None).
+    """
+    texto = os.getenv(texto, por_defecto)
+    if not texto or texto == "-":
+        return None
+    return {int(n) for n in texto.split(",")}
+
+
+# El reconocimiento se queda con todos los núcleos menos el primero, que es para el servidor web
+NUCLEOS_WEB = leer_nucleos("NUCLEOS_WEB", "0" if NUM_NUCLEOS > 1 else "")
+NUCLEOS_CAJA = leer_nucleos("NUCLEOS_CAJA", ",".join(str(n) for n in range(1, NUM_NUCLEOS)))
+NICE_WEB = int(os.getenv("NICE_WEB", "10"))  # El servidor web cede la CPU al reconocimiento
+NICE_CAJA = int(os.getenv("NICE_CAJA", "0"))  # Valores negativos necesitan root
+URL_SALUD_WEB = os.getenv("URL_SALUD_WEB", f"http://127.0.0.1:{os.getenv('PUERTO_WEB', '5000')}/salud")
+
+
+class Servicio:
+    """
+    Proceso supervisado. Está sano mientras no termina y, pasado PLAZO_ARRANQUE,
+    mientras su latido tenga menos de `max_latido` segundos o su `url_salud`
+    responda (se toleran `fallos_salud` fallos seguidos).
+    """
+
+    def __init__(self, nombre, script, nucleos=None, nice=0, max_latido=None, url_salud=None, fallos_salud=3):
+        self.nombre = nombre
+        self.script = script
+        self.nucleos = nucleos
+        self.nice = nice
+        self.max_latido = max_latido
+        self.url_salud = url_salud
+        self.fallos_salud = fallos_salud
+        self.proceso = None
+        self.arrancado = None  # Instante (monotónico) del último arranque
+        self.proximo_arranque = 0.0
+        self.reinicios = 0
+        self.fallos_seguidos = 0
+        self.ultimo_fallo = None
+        self._fallos_url = 0
 
-    # Crear un proceso independiente para el servidor web
-    web = multiprocessing.Process(target=run_web)
+    def arrancar(self):
+        latido.olvidar(self.nombre)
+        # Grupo de procesos propio: al pararlo caen también sus hijos (pool, recargador de Flask)
+        self.proceso = subprocess.Popen([sys.executable, self.script], cwd=DIRECTORIO, start_new_session=True)
+        self.arrancado = time.monotonic()
+        self._fallos_url = 0
+        try:
+            if self.nucleos:
+                os.sched_setaffinity(self.proceso.pid, self.nucleos)
+            if self.nice:
+                os.setpriority(os.PRIO_PROCESS, self.proceso.pid, self.nice)
+        except (AttributeError, OSError) as e:
+            print(f"No se pudo fijar la afinidad o la prioridad de {self.nombre}: {e}")
+        print(f"Servicio {self.nombre} arrancado (pid {self.proceso.pid}).")
 
-    # Crear un proceso independiente para el sistema de reconocimiento facial
-    caja = multiprocessing.Process(target=run_caja)
+    def comprobar(self):
+        """
+        Devuelve None si el servicio está sano o el motivo por el que no lo está.
+        """
+        codigo = self.proceso.poll()
+        if codigo is not None:
+            return f"terminó con código {codigo}"
+        if time.monotonic() - self.arrancado < PLAZO_ARRANQUE:
+            return None
+        if self.max_latido is not None:
+            edad = latido.edad(self.nombre)
+            if edad is None or edad > self.max_latido:
+                return "no envía latidos"
+        if self.url_salud is not None:
+            try:
+                with urllib.request.urlopen(self.url_salud, timeout=2):
+                    self._fallos_url = 0
+            except Exception as e:
+                self._fallos_url += 1
+                if self._fallos_url >= self.fallos_salud:
+                    return f"no responde ({e})"
+        if self.fallos_seguidos and time.monotonic() - self.arrancado > ESTABLE:
+            self.fallos_seguidos = 0
+        return None
 
-    # Iniciar el proceso que ejecuta "web.py"
-    web.start()
+    def detener(self):
+        """
+        Pide al grupo del proceso que termine (SIGTERM) y lo mata si no lo hace a tiempo.
+        Se avisa al grupo aunque el proceso ya haya terminado, por si dejó hijos.
+        """
+        if self.proceso is None:
+            return
+        try:
+            os.killpg(self.proceso.pid, signal.SIGTERM)
+            self.proceso.wait(PLAZO_PARADA)
+        except subprocess.TimeoutExpired:
+            print(f"{self.nombre} no terminó a tiempo; se mata.")
+            os.killpg(self.proceso.pid, signal.SIGKILL)
+            self.proceso.wait()
+        except ProcessLookupError:
+            pass
 
-    # Iniciar el proceso que ejecuta "caja.py"
-    caja.start()
+    def fallo(self, motivo):
+        """
+        Detiene el servicio caído y programa su reinicio con espera exponencial.
+        """
+        self.detener()
+        self.proceso = None
+        self.reinicios += 1
+        self.fallos_seguidos += 1
+        self.ultimo_fallo = {"instante": time.time(), "motivo": motivo}
+        espera = min(2 ** (self.fallos_seguidos - 1), ESPERA_MAXIMA)
+        self.proximo_arranque = time.monotonic() + espera
+        print(f"Servicio {self.nombre} caído: {motivo}. Reinicio en {espera} s.")
 
-    # Esperar a que el proceso "web" termine antes de continuar
-    web.join()
+    def como_dict(self):
+        vivo = self.proceso is not None and self.proceso.poll() is None
+        return {
+            "pid": self.proceso.pid if vivo else None,
+            "activo": vivo,
+            "segundos_activo": round(time.monotonic() - self.arrancado) if vivo else None,
+            "latido": latido.edad(self.nombre),
+            "reinicios": self.reinicios,
+            "ultimo_fallo": self.ultimo_fallo,
+        }
 
-    # Esperar a que el proceso "caja" termine antes de continuar
-    caja.join()
 
+def escribir_estado(servicios):
+    """
+    Escribe el estado de los servicios de forma atómica para consultarlo desde fuera.
+    """
+    estado = {"instante": time.time(), "servicios": {s.nombre: s.como_dict() for s in servicios}}
+    try:
+        os.makedirs(os.path.dirname(ESTADO) or ".", exist_ok=True)
+        with open(ESTADO + ".tmp", "w") as archivo:
+            json.dump(estado, archivo, indent=2)
+        os.replace(ESTADO + ".tmp", ESTADO)
+    except OSError as e:
+        print(f"Error al escribir el estado de los servicios: {e}")
+
+
+def supervisar(servicios):
+    """
+    Arranca los servicios y los vigila hasta recibir SIGTERM o SIGINT;
+    entonces los detiene en orden inverso.
+    """
+    parar = []
+    signal.signal(signal.SIGTERM, lambda *_: parar.append(True))
+    signal.signal(signal.SIGINT, lambda *_: parar.append(True))
+    while not parar:
+        for servicio in servicios:
+            if servicio.proceso is None:
+                if time.monotonic() >= servicio.proximo_arranque:
+                    servicio.arrancar()
+                continue
+            motivo = servicio.comprobar()
+            if motivo is not None:
+                servicio.fallo(motivo)
+        escribir_estado(servicios)
+        time.sleep(INTERVALO)
+    print("Deteniendo los servicios.")
+    for servicio in reversed(servicios):
+        servicio.detener()
+    escribir_estado(servicios)
+
+
+if __name__ == "__main__":
+    # Bloque principal del script, asegura que el código dentro de este bloque
+    # solo se ejecute cuando el archivo se ejecuta directamente, no cuando es importado.
+    supervisar([
+        # caja.py primero: la caja queda protegida aunque el servidor web tarde en arrancar
+        Servicio("caja", "caja.py", NUCLEOS_CAJA, NICE_CAJA, max_latido=10),
+        Servicio("web", "web.py", NUCLEOS_WEB, NICE_WEB, url_salud=URL_SALUD_WEB),
+    ])
@@ -0,0 +1,111 @@
+import heapq  # Cola de prioridad para las tareas programadas
+import itertools  # Contador para desempatar tareas con el mismo instante
+import threading  # Manejo de hilos para tareas concurrentes
+from reloj import RelojReal
+
+
+class Actuadores(threading.Thread):
+    """
+    Planificador de actuadores: ejecuta movimientos del servo, patrones de LEDs
+    y patrones del buzzer como tareas temporizadas en un único hilo.
+    Cada patrón pertenece a un canal ("servo", "leds", "buzzer"); programar un
+    patrón nuevo en un canal sustituye al anterior y cancelar un canal descarta
+    sus pasos pendientes y ejecuta su acción de parada.
+    Quien programa nunca espera: solo se añaden tareas a la cola.
+    """
+
+    def __init__(self, reloj=None):
+        super().__init__(daemon=True, name="actuadores")
+        self.reloj = reloj or RelojReal()  # Reloj con el que se miden los retardos
+        self._tareas = []  # Montículo de (instante, orden, canal, generación, función)
+        self._orden = itertools.count()
+        self._generacion = {}  # canal -> generación vigente; las tareas antiguas se ignoran
+        self._al_cancelar = {}  # canal -> acción que deja el actuador en reposo
+        self._condicion = threading.Condition()
+        # Evita que una tarea se ejecute mientras se cancela su canal; es reentrante
+        # para que una tarea pueda programar o cancelar otros patrones.
+        self._ejecucion = threading.RLock()
+
+    def programar(self, canal, pasos, al_cancelar=None):
+        """
+        Programa una secuencia de pasos (retardo, función) en el canal; cada retardo
+        se cuenta desde el paso anterior. Sustituye a lo que hubiera pendiente en el canal.
+        """
+        self.cancelar(canal)
+        with self._condicion:
+            generacion = self._generacion.get(canal, 0)
+            self._al_cancelar[canal] = al_cancelar
+            instante = self.reloj.monotonic()
+            for retardo, funcion in pasos:
+                instante += retardo
+                heapq.heappush(self._tareas, (instante, next(self._orden), canal, generacion, funcion))
+            self._condicion.notify()
+
+    def cancelar(self, canal):
+        """
+        Descarta los pasos pendientes del canal y ejecuta su acción de parada.
+        """
+        with self._ejecucion:
+            with self._condicion:
+                self._generacion[canal] = self._generacion.get(canal, 0) + 1
+                pendientes = len(self._tareas)
+                self._tareas = [t for t in self._tareas if t[2] != canal]
+                heapq.heapify(self._tareas)
+                al_cancelar = self._al_cancelar.pop(canal, None)
+                activo = pendientes != len(self._tareas)
+            if activo and al_cancelar is not None:
+                al_cancelar()
+
+    def activo(self, canal):
+        """
+        Indica si el canal tiene pasos pendientes.
+        """
+        with self._condicion:
+            return any(t[2] == canal for t in self._tareas)
+
+    def run(self):
+        while True:
+            with self._condicion:
+                while not self._tareas or self._tareas[0][0] > self.reloj.monotonic():
+                    espera = self._tareas[0][0] - self.reloj.monotonic() if self._tareas else None
+                    self._condicion.wait(self.reloj.a_real(espera) if espera is not None else None)
+                _, _, canal, generacion, funcion = heapq.heappop(self._tareas)
+            with self._ejecucion:
+                if generacion != self._generacion.get(canal, 0):
+                    continue  # El canal se canceló o se sustituyó después de sacar la tarea
+                if not any(t[2] == canal for t in self._tareas):
+                    self._al_cancelar.pop(canal, None)  # Último paso: ya no hay nada que parar
+                try:
+                    funcion()
+                except Exception as e:
+                    print(f"Error en el actuador {canal}: {e}")
+
+
+def patron_sirena(pwm, duracion, grave=600, agudo=1200, paso=50, tiempo_paso=0.05):
+    """
+    Pasos de una sirena de policía para un PWM: barre la frecuencia de grave a
+    agudo y vuelta durante `duracion` segundos y termina en silencio.
+    El último barrido se corta donde toque para no pasarse de `duracion`.
+    La frecuencia la genera el PWM, así que el tono no depende de los retardos de Python.
+    """
+    barrido = list(range(grave, agudo, paso)) + list(range(agudo, grave, -paso))
+    pasos = [(0, lambda: (pwm.ChangeFrequency(grave), pwm.ChangeDutyCycle(50)))]
+    # Cada paso espera tiempo_paso antes de ejecutarse; el silencio final también cuenta
+    cambios = max(int(round(duracion / tiempo_paso)) - 1, 0)
+    for i in range(cambios):
+        pasos.append((tiempo_paso, lambda f=barrido[i % len(barrido)]: pwm.ChangeFrequency(f)))
+    pasos.append((tiempo_paso, lambda: pwm.ChangeDutyCycle(0)))
+    return pasos
+
+
+def patron_parpadeo(encender, apagar, duracion, periodo=0.5, final=None):
+    """
+    Pasos para hacer parpadear un LED durante `duracion` segundos.
+    `final` se ejecuta al terminar (por ejemplo, para restaurar el estado fijo).
+    """
+    pasos = []
+    for i in range(int(duracion / (periodo / 2))):
+        pasos.append((0 if i == 0 else periodo / 2, encender if i % 2 == 0 else apagar))
+    if final is not None:
+        pasos.append((periodo / 2, final))
+    return pasos
@@ -0,0 +1,258 @@
+import csv  # Lista de personas (nombre,email) de las altas masivas
+import io  # Imágenes decodificadas en memoria, sin archivos temporales
+import multiprocessing  # Contexto "spawn" para el pool de codificación
+import os
+import threading  # Manejo de hilos para tareas concurrentes
+import time  # Instantes de creación de los trabajos
+import uuid  # Identificadores de los trabajos
+import zipfile  # Altas masivas en un único archivo ZIP
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import basedatos  # Esquema de users.db
+import codificador  # Lo que ejecutan los procesos del pool, sin efectos al importarse
+import instantanea  # Instantánea de la galería para caja.py
+import avisos  # Avisos de altas a caja.py
+
+EXTENSIONES = {"png", "jpg", "jpeg"}  # Extensiones de imagen admitidas
+MAX_IMAGEN = 10 * 1024 * 1024  # Tamaño máximo de cada imagen descomprimida del ZIP
+MAX_IMAGENES = 500  # Imágenes como máximo en un alta masiva
+CONSERVAR_TRABAJOS = 200  # Trabajos terminados que se recuerdan para consultar su estado
+ESPERA_INACTIVO = float(os.getenv("ESPERA_ALTAS", "300"))  # Segundos sin altas tras los que se cierra el pool
+
+
+def extension_valida(nombre_archivo):
+    return "." in nombre_archivo and nombre_archivo.rsplit(".", 1)[1].lower() in EXTENSIONES
+
+
+def persona_de_archivo(ruta):
+    """
+    Nombre de la persona de una imagen de un alta masiva: la carpeta que la
+    contiene (`ana/1.jpg`) o, si no hay carpeta, el nombre del archivo sin el
+    número final (`ana_2.jpg`, `ana.jpg`).
+    """
+    partes = [p for p in ruta.replace("\\", "/").split("/") if p]
+    if len(partes) > 1:
+        return partes[-2]
+    base = os.path.splitext(partes[-1])[0]
+    prefijo, _, numero = base.rpartition("_")
+    return prefijo if prefijo and numero.isdigit() else base
+
+
+def leer_correos(texto):
+    """
+    Lee líneas `nombre,email` y devuelve un diccionario {nombre: email}.
+    """
+    return {fila[0].strip(): fila[1].strip() for fila in csv.reader(io.StringIO(texto)) if len(fila) >= 2}
+
+
+def agrupar(archivos, correos):
+    """
+    Agrupa una lista de (ruta, datos) por persona. Devuelve una lista de
+    (nombre, email, [datos de imagen]); el email es None si no aparece en `correos`.
+    """
+    personas = OrderedDict()
+    for ruta, datos in archivos:
+        personas.setdefault(persona_de_archivo(ruta), []).append(datos)
+    return [(nombre, correos.get(nombre), imagenes) for nombre, imagenes in personas.items()]
+
+
+def leer_zip(datos, correos):
+    """
+    Extrae las imágenes de un ZIP con una carpeta (o un prefijo de archivo) por
+    persona y, opcionalmente, un `personas.csv` con `nombre,email`. Ignora las
+    entradas que no son imágenes o que superan MAX_IMAGEN una vez descomprimidas.
+    """
+    archivos = []
+    correos = dict(correos)
+    with zipfile.ZipFile(io.BytesIO(datos)) as archivo_zip:
+        for info in archivo_zip.infolist():
+            if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                continue
+            if os.path.basename(info.filename).lower() == "personas.csv":
+                correos.update(leer_correos(archivo_zip.read(info).decode("utf-8-sig")))
+            elif extension_valida(info.filename) and info.file_size <= MAX_IMAGEN and len(archivos) < MAX_IMAGENES:
+                archivos.append((info.filename, archivo_zip.read(info)))
+    return agrupar(archivos, correos)
+
+
+class Trabajo:
+    """
+    Alta (de una o varias personas) en curso. `resultados` tiene una entrada
+    por persona con el nombre asignado, las muestras guardadas o el error.
+    """
+
+    def __init__(self, personas):
+        self.id = uuid.uuid4().hex
+        self.creado = time.time()
+        self.estado = "en cola"  # "en cola", "codificando", "terminado" o "error"
+        self.total = sum(len(imagenes) for _, _, imagenes in personas)
+        self.procesadas = 0
+        self.resultados = []
+
+    def como_dict(self):
+        return {
+            "id": self.id,
+            "creado": self.creado,
+            "estado": self.estado,
+            "imagenes": self.total,
+            "procesadas": self.procesadas,
+            "resultados": list(self.resultados),
+        }
+
+
+class GestorAltas:
+    """
+    Ejecuta las altas fuera de las peticiones web. Las imágenes se codifican en
+    paralelo en un pool de procesos; un único hilo coordinador recoge las
+    codificaciones, escribe en la base de datos, publica la instantánea y avisa
+    a caja.py una vez por trabajo. al_registrar(nombre, email, muestras) se
+    llama desde ese hilo por cada usuario dado de alta (para las notificaciones).
+
+    El pool se crea con la primera alta y cada proceso carga los modelos con su
+    primera imagen; tras `espera` segundos sin altas se cierra, para que dlib y
+    sus modelos no ocupen memoria mientras nadie registra usuarios. `listo` está
+    activo mientras hay procesos con los modelos ya cargados.
+    """
+
+    def __init__(self, ruta_bd, procesos=2, al_registrar=None, espera=ESPERA_INACTIVO):
+        self.ruta_bd = ruta_bd
+        self.al_registrar = al_registrar
+        self.num_procesos = procesos
+        self.espera = espera
+        self._procesos = None  # Se crea con la primera alta
+        self._coordinador = ThreadPoolExecutor(1, thread_name_prefix="altas")
+        self._trabajos = OrderedDict()
+        self._lock = threading.Lock()
+        self._activos = 0  # Trabajos en cola o en curso
+        self._ultimo_uso = time.monotonic()
+        self.listo = threading.Event()
+
+    def _crear_pool(self):
+        # "spawn": los procesos no heredan los hilos ni los sockets del servidor web
+        self.listo.clear()
+        return ProcessPoolExecutor(self.num_procesos, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=codificador.inicializar_proceso)
+
+    def _codificar(self, imagenes):
+        """
+        Envía las imágenes al pool, creándolo si hace falta. Si un proceso murió
+        (por ejemplo, sin memoria) el pool queda inservible, así que se crea otro
+        y se reintenta una vez. Se llama con el lock tomado.
+        """
+        if self._procesos is None:
+            self._procesos = self._crear_pool()
+        try:
+            return [self._procesos.submit(codificador.codificar_imagen, datos) for datos in imagenes]
+        except BrokenProcessPool:
+            print("El pool de codificación se rompió; se crea uno nuevo.")
+            self._procesos = self._crear_pool()
+            return [self._procesos.submit(codificador.codificar_imagen, datos) for datos in imagenes]
+
+    def _cerrar_si_inactivo(self):
+        """
+        Cierra el pool si no hay trabajos y lleva `espera` segundos sin usarse.
+        """
+        with self._lock:
+            if self._procesos is None or self._activos or time.monotonic() - self._ultimo_uso < self.espera:
+                return
+            procesos, self._procesos = self._procesos, None
+            self.listo.clear()
+        procesos.shutdown(wait=False)
+        print("Pool de altas cerrado por inactividad.")
+
+    def alta(self, nombre, email, imagenes):
+        """
+        Encola el alta de una persona con una o varias imágenes (bytes) y devuelve el id del trabajo.
+        """
+        return self.lote([(nombre, email, imagenes)])
+
+    def lote(self, personas):
+        """
+        Encola el alta de varias personas [(nombre, email, [bytes])] y devuelve el id del trabajo.
+        Las imágenes empiezan a codificarse ya, en paralelo.
+        """
+        trabajo = Trabajo(personas)
+        with self._lock:
+            futuros = [self._codificar(imagenes) for _, _, imagenes in personas]
+            self._activos += 1
+            self._trabajos[trabajo.id] = trabajo
+            while len(self._trabajos) > CONSERVAR_TRABAJOS:
+                self._trabajos.popitem(last=False)
+        self._coordinador.submit(self._ejecutar, trabajo, personas, futuros)
+        return trabajo.id
+
+    def estado(self, id_trabajo):
+        """
+        Devuelve el estado de un trabajo como diccionario, o None si no existe.
+        """
+        with self._lock:
+            trabajo = self._trabajos.get(id_trabajo)
+        return trabajo.como_dict() if trabajo is not None else None
+
+    def _ejecutar(self, trabajo, personas, futuros):
+        trabajo.estado = "codificando"
+        registrados = []
+        try:
+            conn = basedatos.conectar(self.ruta_bd)  # El hilo coordinador reutiliza siempre la misma
+            for (nombre, email, _), pendientes in zip(personas, futuros):
+                encodings = []
+                for futuro in pendientes:
+                    try:
+                        encoding = futuro.result()
+                        self.listo.set()  # Este proceso ya tiene los modelos cargados
+                        if encoding is not None:
+                            encodings.append(encoding)
+                    except Exception as e:
+                        print(f"Error al codificar una imagen de {nombre}: {e}")
+                    trabajo.procesadas += 1
+                try:
+                    resultado = self._guardar(conn, nombre, email, encodings)
+                except Exception as e:
+                    # Solo se pierde el alta de esta persona; las demás siguen adelante
+                    print(f"Error al dar de alta a {nombre}: {e}")
+                    conn.rollback()
+                    resultado = {"nombre": nombre, "error": f"No se pudo guardar: {e}"}
+                trabajo.resultados.append(resultado)
+                if "usuario" in resultado:
+                    registrados.append((resultado["usuario"], email, len(encodings)))
+            if registrados:
+                instantanea.publicar(conn)
+            trabajo.estado = "terminado"
+        except Exception as e:
+            print(f"Error en el trabajo de alta {trabajo.id}: {e}")
+            trabajo.estado = "error"
+        with self._lock:
+            self._activos -= 1
+            self._ultimo_uso = time.monotonic()
+        temporizador = threading.Timer(self.espera, self._cerrar_si_inactivo)
+        temporizador.daemon = True
+        temporizador.start()
+
+        for usuario, email, muestras in registrados:
+            avisos.enviar(avisos.ALTA, usuario)
+            if self.al_registrar is not None:
+                try:
+                    self.al_registrar(usuario, email, muestras)
+                except Exception as e:
+                    print(f"Error al notificar el alta de {usuario}: {e}")
+
+    def _guardar(self, conn, nombre, email, encodings):
+        """
+        Da de alta a una persona y devuelve su entrada de resultados.
+        """
+        if not email:
+            return {"nombre": nombre, "error": "Falta el correo electrónico"}
+        if not encodings:
+            return {"nombre": nombre, "error": "No se detectó ninguna cara"}
+        if basedatos.correo_registrado(conn, email):
+            return {"nombre": nombre, "error": "El correo ya está registrado"}
+        unique_name = basedatos.nombre_unico(conn, nombre)
+        basedatos.insertar_usuario(conn, unique_name, email, encodings)
+        conn.commit()
+        return {"nombre": nombre, "usuario": unique_name, "muestras": len(encodings)}
+
+    def detener(self):
+        self._coordinador.shutdown(wait=False)
+        if self._procesos is not None:
+            self._procesos.shutdown(wait=False)
@@ -0,0 +1,32 @@
+import time  # Instantes de cada fase del arranque
+
+
+class Cronometro:
+    """
+    Mide cuánto tarda cada fase del arranque de un proceso. Se crea al
+    principio del programa y marcar(fase) anota el tiempo desde la marca anterior.
+    """
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.inicio = time.monotonic()
+        self.fases = {}  # fase -> segundos, en el orden en que se marcaron
+        self._ultima = self.inicio
+
+    def marcar(self, fase):
+        ahora = time.monotonic()
+        self.fases[fase] = ahora - self._ultima
+        self._ultima = ahora
+
+    def como_dict(self):
+        return {
+            "total_ms": round((self._ultima - self.inicio) * 1000),
+            "fases_ms": {fase: round(segundos * 1000) for fase, segundos in self.fases.items()},
+        }
+
+    def informe(self):
+        """
+        Imprime la duración total y la de cada fase.
+        """
+        fases = ", ".join(f"{fase} {segundos * 1000:.0f} ms" for fase, segundos in self.fases.items())
+        print(f"Arranque de {self.nombre} en {(self._ultima - self.inicio) * 1000:.0f} ms: {fases}.")
@@ -0,0 +1,102 @@
+import json  # Formato de los avisos
+import os
+import socket  # Socket Unix local entre web.py y caja.py
+import threading  # Manejo de hilos para tareas concurrentes
+import time  # Antigüedad de la marca de avisos perdidos
+
+RUTA = os.getenv("SOCKET_AVISOS", "/tmp/acceso_seguro_avisos.sock")  # Socket de avisos de usuarios
+PERDIDOS = os.getenv("AVISOS_PERDIDOS", RUTA + ".perdido")  # Marca que web.py toca si no puede avisar
+VIGENCIA_PERDIDO = 10.0  # Segundos que caja.py sondea deprisa tras un aviso perdido
+# Web.py y caja.py deben compartir usuario o grupo para poder enviar avisos
+PERMISOS = int(os.getenv("PERMISOS_AVISOS", "660"), 8)
+ALTA = "alta"
+BAJA = "baja"
+
+
+def enviar(tipo, nombre, ruta=RUTA, perdidos=PERDIDOS):
+    """
+    Envía un aviso de alta o baja de usuario sin bloquear. Devuelve False si no
+    se pudo entregar: nadie escucha (caja.py parado o sin socket), no hay permiso
+    para escribir en el socket o su cola está llena (EAGAIN). En ese caso toca la
+    marca `perdidos` para que caja.py vuelva a comprobar la base de datos deprisa.
+    """
+    mensaje = json.dumps({"tipo": tipo, "nombre": nombre}).encode()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as conexion:
+            conexion.setblocking(False)
+            conexion.sendto(mensaje, ruta)
+        return True
+    except OSError as e:
+        print(f"No se pudo enviar el aviso de {tipo} de {nombre}: {e}")
+        marcar_perdido(perdidos)
+        return False
+
+
+def marcar_perdido(perdidos=PERDIDOS):
+    """
+    Actualiza la fecha de la marca de avisos perdidos, creándola si no existe.
+    """
+    try:
+        os.utime(perdidos)
+    except FileNotFoundError:
+        try:
+            open(perdidos, "a").close()
+        except OSError as e:
+            print(f"No se pudo crear la marca de avisos perdidos {perdidos}: {e}")
+    except OSError as e:
+        print(f"No se pudo actualizar la marca de avisos perdidos {perdidos}: {e}")
+
+
+class ReceptorAvisos(threading.Thread):
+    """
+    Hilo que escucha en un socket Unix de datagramas los avisos de web.py y
+    llama a al_recibir(tipo, nombre) por cada uno. `activo` indica si el canal
+    está funcionando, para que el llamador sepa si puede espaciar sus sondeos:
+    deja de estarlo durante `vigencia` segundos cada vez que web.py marca un
+    aviso perdido.
+    """
+
+    def __init__(self, al_recibir, ruta=RUTA, perdidos=PERDIDOS, vigencia=VIGENCIA_PERDIDO):
+        super().__init__(daemon=True, name="avisos")
+        self.al_recibir = al_recibir
+        self.ruta = ruta
+        self.perdidos = perdidos
+        self.vigencia = vigencia
+        self.abierto = False  # El socket llegó a abrirse (si no, caja.py sondea la base de datos)
+        self._escuchando = False
+
+    @property
+    def activo(self):
+        if not self._escuchando:
+            return False
+        try:
+            return time.time() - os.path.getmtime(self.perdidos) > self.vigencia
+        except OSError:
+            return True  # Sin marca: nunca se ha perdido un aviso
+
+    def run(self):
+        try:
+            try:
+                os.unlink(self.ruta)  # Socket huérfano de una ejecución anterior
+            except FileNotFoundError:
+                pass
+            conexion = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            conexion.bind(self.ruta)
+            os.chmod(self.ruta, PERMISOS)  # Por defecto, el usuario y el grupo de la caja
+        except OSError as e:
+            print(f"No se pudo abrir el socket de avisos {self.ruta}: {e}")
+            return
+
+        self.abierto = True
+        self._escuchando = True
+        try:
+            while True:
+                datos = conexion.recv(4096)
+                try:
+                    aviso = json.loads(datos)
+                    self.al_recibir(aviso["tipo"], aviso["nombre"])
+                except Exception as e:
+                    print(f"Error al procesar el aviso {datos!r}: {e}")
+        finally:
+            self._escuchando = False
+            conexion.close()
@@ -0,0 +1,286 @@
+import os
+import sqlite3  # Conexión con la base de datos SQLite
+import threading  # Conexiones reutilizadas por hilo
+import numpy as np  # Operaciones con arreglos y cálculos matemáticos
+
+# Versiones del esquema de users.db (se guardan en PRAGMA user_version):
+#  1: users(name, email, encoding) con una única codificación float64 por usuario.
+#  2: users(id, name, email, centroid) y encodings(id, user_id, encoding) con
+#     varias muestras float32 por usuario y su centroide.
+#  3: igual que el 2 más índices para el correo (único) y para buscar por
+#     prefijo de nombre o correo sin distinguir mayúsculas.
+#  4: igual que el 3 más la tabla generacion, un contador que unos triggers
+#     aumentan con cada cambio en users o encodings.
+VERSION_ESQUEMA = 4
+TIPO_CODIFICACION = np.float32  # Tipo de las codificaciones guardadas desde el esquema 2
+LIMITE_PARAMETROS = 500  # Claves por consulta IN (...) para no superar el límite de SQLite
+RUTA = os.getenv("USERS_DB", "users.db")  # Base de datos compartida por web.py, caja.py y desarrollo/
+ESPERA_BLOQUEO = 5.0  # Segundos que una conexión espera a que se libere un bloqueo antes de fallar
+SENTENCIAS_CACHEADAS = 256  # Sentencias preparadas que guarda cada conexión
+
+_locales = threading.local()  # Conexiones de cada hilo
+
+
+def conectar(ruta=RUTA):
+    """
+    Devuelve la conexión de este hilo con la base de datos, creándola la primera vez.
+    Todas las conexiones usan WAL, así que los lectores (caja.py) nunca esperan a
+    los escritores (web.py) ni al revés, y un busy_timeout en lugar de fallar con
+    "database is locked". Al reutilizar la conexión se reutilizan también sus
+    sentencias preparadas. No se debe cerrar ni llamar en mitad de una transacción.
+    """
+    conexiones = getattr(_locales, "conexiones", None)
+    if conexiones is None:
+        conexiones = _locales.conexiones = {}
+    conn = conexiones.get(ruta)
+    if conn is None:
+        conn = sqlite3.connect(ruta, timeout=ESPERA_BLOQUEO, cached_statements=SENTENCIAS_CACHEADAS)
+        conn.row_factory = sqlite3.Row  # Filas accesibles por índice y por nombre de columna
+        conn.execute("PRAGMA journal_mode=WAL")  # Persistente: queda guardado en el archivo
+        conn.execute("PRAGMA synchronous=NORMAL")  # Suficiente con WAL y mucho más barato por commit
+        conexiones[ruta] = conn
+    elif conn.in_transaction:
+        conn.rollback()  # Transacción abandonada por un error en un uso anterior
+    return conn
+
+
+def version_esquema(conn):
+    """
+    Devuelve la versión del esquema de la base de datos (0 si aún no hay tabla de usuarios).
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version:
+        return version
+    columnas = [fila[1] for fila in conn.execute("PRAGMA table_info(users)")]
+    return 1 if "encoding" in columnas else 0
+
+
+def codificacion_a_blob(encoding):
+    return np.asarray(encoding, dtype=TIPO_CODIFICACION).tobytes()
+
+
+def blob_a_codificacion(blob, version=VERSION_ESQUEMA):
+    """
+    Decodifica un BLOB de codificación según la versión del esquema que lo guardó.
+    """
+    return np.frombuffer(blob, dtype=np.float64 if version == 1 else TIPO_CODIFICACION)
+
+
+def _crear_tablas(conn):
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS users ("
+        "id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, email TEXT, centroid BLOB)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS encodings ("
+        "id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE, "
+        "encoding BLOB NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS encodings_user_id ON encodings(user_id)")
+
+
+def _crear_indices(conn):
+    """
+    Índices del esquema 3. Si una base de datos antigua ya tiene correos
+    repetidos no se puede crear el índice único y se crea uno normal.
+    """
+    try:
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_email ON users(email)")
+    except sqlite3.IntegrityError:
+        print("Hay correos repetidos en users: el índice de correo no será único.")
+        conn.execute("CREATE INDEX IF NOT EXISTS users_email ON users(email)")
+    conn.execute("CREATE INDEX IF NOT EXISTS users_name_nocase ON users(name COLLATE NOCASE)")
+    conn.execute("CREATE INDEX IF NOT EXISTS users_email_nocase ON users(email COLLATE NOCASE)")
+
+
+def _crear_generacion(conn):
+    """
+    Contador de cambios del esquema 4. Lo mantienen los triggers, así que cuenta
+    también los cambios hechos desde desarrollo/ o a mano.
+    """
+    conn.execute("CREATE TABLE IF NOT EXISTS generacion (valor INTEGER NOT NULL)")
+    if conn.execute("SELECT COUNT(*) FROM generacion").fetchone()[0] == 0:
+        conn.execute("INSERT INTO generacion (valor) VALUES (0)")
+    for tabla in ("users", "encodings"):
+        for operacion in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS {tabla}_{operacion.lower()}_generacion AFTER {operacion} ON {tabla} "
+                "BEGIN UPDATE generacion SET valor = valor + 1; END"
+            )
+
+
+def generacion(conn):
+    """
+    Devuelve el contador de cambios de la galería, o None si el esquema no lo tiene.
+    A diferencia de PRAGMA data_version, se puede comparar entre conexiones y procesos.
+    """
+    try:
+        return conn.execute("SELECT valor FROM generacion").fetchone()[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def preparar(conn):
+    """
+    Deja la base de datos en la versión actual del esquema: crea las tablas si no
+    existen o migra una tabla de usuarios antigua. La migración se hace en una
+    única transacción, así que web.py y caja.py pueden llamarla a la vez.
+    """
+    if conn.execute("PRAGMA user_version").fetchone()[0] == VERSION_ESQUEMA:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = version_esquema(conn)  # Se vuelve a leer ya con el bloqueo de escritura
+        if version == 1:
+            _migrar_desde_v1(conn)
+        elif version == 0:
+            _crear_tablas(conn)
+        if version < 3:
+            _crear_indices(conn)
+        if version < 4:
+            _crear_generacion(conn)
+        conn.execute(f"PRAGMA user_version = {VERSION_ESQUEMA}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _migrar_desde_v1(conn):
+    """
+    Pasa cada usuario del esquema 1 a una fila de users con su centroide y a una
+    muestra en encodings, ambas en float32. Se conserva el rowid como id.
+    """
+    columnas = [fila[1] for fila in conn.execute("PRAGMA table_info(users)")]
+    email = "email" if "email" in columnas else "NULL"  # La tabla de desarrollo/ no tenía correo
+    conn.execute("ALTER TABLE users RENAME TO users_v1")
+    _crear_tablas(conn)
+    filas = conn.execute(f"SELECT rowid, name, {email}, encoding FROM users_v1").fetchall()
+    for rowid, name, correo, blob in filas:
+        blob = codificacion_a_blob(blob_a_codificacion(blob, 1))
+        conn.execute("INSERT INTO users (id, name, email, centroid) VALUES (?, ?, ?, ?)", (rowid, name, correo, blob))
+        conn.execute("INSERT INTO encodings (user_id, encoding) VALUES (?, ?)", (rowid, blob))
+    conn.execute("DROP TABLE users_v1")
+    print(f"Base de datos migrada al esquema {VERSION_ESQUEMA}: {len(filas)} usuarios.")
+
+
+def insertar_usuario(conn, name, email, encodings):
+    """
+    Inserta un usuario con sus muestras y su centroide, y devuelve su id.
+    No confirma la transacción.
+    """
+    muestras = np.asarray(encodings, dtype=TIPO_CODIFICACION).reshape(len(encodings), -1)
+    cursor = conn.execute(
+        "INSERT INTO users (name, email, centroid) VALUES (?, ?, ?)",
+        (name, email, codificacion_a_blob(muestras.mean(axis=0))),
+    )
+    user_id = cursor.lastrowid
+    conn.executemany(
+        "INSERT INTO encodings (user_id, encoding) VALUES (?, ?)",
+        [(user_id, codificacion_a_blob(muestra)) for muestra in muestras],
+    )
+    return user_id
+
+
+def correo_registrado(conn, email):
+    """
+    Indica si ya hay un usuario con ese correo.
+    """
+    return conn.execute("SELECT 1 FROM users WHERE email = ?", (email,)).fetchone() is not None
+
+
+def nombre_unico(conn, name):
+    """
+    Devuelve `name` si está libre o el primer `name_NNN` que no esté en uso.
+    Una sola consulta recorre en el índice de nombres el rango `name`, `name_*`
+    ('`' es el carácter siguiente a '_').
+    """
+    ocupados = {
+        fila[0] for fila in conn.execute(
+            "SELECT name FROM users WHERE name = ? OR (name >= ? AND name < ?)",
+            (name, name + "_", name + "`"),
+        )
+    }
+    if name not in ocupados:
+        return name
+    counter = 1
+    while f"{name}_{str(counter).zfill(3)}" in ocupados:
+        counter += 1
+    return f"{name}_{str(counter).zfill(3)}"
+
+
+def buscar_usuarios(conn, prefijo="", despues=None, limite=50):
+    """
+    Página de usuarios ordenada por nombre (sin distinguir mayúsculas) con
+    paginación por clave: `despues` es el (nombre, id) de la última fila de la
+    página anterior. Con `prefijo` solo devuelve los usuarios cuyo nombre o
+    correo empieza por él. Sin prefijo, la página es un rango sobre el índice
+    users_name_nocase y solo se leen las filas que se devuelven; con prefijo
+    se recorren los usuarios que lo cumplen (por nombre o por correo) y se
+    ordenan, así que el coste crece con las coincidencias, no con el total.
+    Devuelve las filas (id, name, email).
+    """
+    condiciones, parametros = [], []
+    if prefijo:
+        fin = prefijo + "\U0010ffff"
+        condiciones.append(
+            "((name COLLATE NOCASE >= ? AND name COLLATE NOCASE < ?)"
+            " OR (email COLLATE NOCASE >= ? AND email COLLATE NOCASE < ?))"
+        )
+        parametros += [prefijo, fin, prefijo, fin]
+    if despues is not None:
+        # Desplegada para que SQLite la use como rango sobre users_name_nocase
+        condiciones.append("(name COLLATE NOCASE >= ? AND (name COLLATE NOCASE > ? OR id > ?))")
+        nombre, identificador = despues
+        parametros += [nombre, nombre, identificador]
+    donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return conn.execute(
+        f"SELECT id, name, email FROM users {donde} ORDER BY name COLLATE NOCASE, id LIMIT ?",
+        parametros + [limite],
+    ).fetchall()
+
+
+def eliminar_usuario(conn, name):
+    """
+    Elimina un usuario y sus muestras. No confirma la transacción.
+    """
+    conn.execute("DELETE FROM encodings WHERE user_id IN (SELECT id FROM users WHERE name = ?)", (name,))
+    conn.execute("DELETE FROM users WHERE name = ?", (name,))
+
+
+def _consulta(version, centroides):
+    """
+    Devuelve (tabla con alias, columna clave, columna codificación) para leer la galería.
+    """
+    if version == 1:
+        return "users u", "u.rowid", "u.encoding"
+    if centroides:
+        return "users u", "u.id", "u.centroid"
+    return "encodings e JOIN users u ON u.id = e.user_id", "e.id", "e.encoding"
+
+
+def listar_claves(conn, version, centroides=False):
+    """
+    Devuelve las filas (clave, nombre) de la galería sin leer las codificaciones.
+    La clave es el id de cada muestra (o del usuario si se usan centroides).
+    """
+    tabla, clave, _ = _consulta(version, centroides)
+    return conn.execute(f"SELECT {clave}, u.name FROM {tabla}").fetchall()
+
+
+def leer_codificaciones(conn, version, claves=None, centroides=False):
+    """
+    Devuelve las filas (clave, nombre, codificación) de la galería, todas o solo
+    las de `claves`, decodificadas según la versión del esquema.
+    """
+    tabla, clave, codificacion = _consulta(version, centroides)
+    consulta = f"SELECT {clave}, u.name, {codificacion} FROM {tabla}"
+    if claves is None:
+        filas = conn.execute(consulta).fetchall()
+    else:
+        filas = []
+        for i in range(0, len(claves), LIMITE_PARAMETROS):
+            bloque = claves[i:i + LIMITE_PARAMETROS]
+            marcadores = ",".join("?" * len(bloque))
+            filas += conn.execute(f"{consulta} WHERE {clave} IN ({marcadores})", bloque).fetchall()
+    return [(fila[0], fila[1], blob_a_codificacion(fila[2], version)) for fila in filas]
@@ -1,14 +1,28 @@
+from arranque import Cronometro  # Duración de cada fase del arranque
+cronometro = Cronometro("caja")
+
 import os
 from dotenv import load_dotenv  # Librería para cargar variables de entorno desde un archivo .env
-import RPi.GPIO as GPIO  # Control de los pines GPIO de la Raspberry Pi
+from hardware import GPIO, reloj, crear_camara, SIMULADO  # Raspberry Pi real o simulada
 import cv2  # Procesamiento de imágenes y captura de video
-import face_recognition  # Reconocimiento facial
-import numpy as np  # Operaciones con arreglos y cálculos matemáticos
-import time  # Manejo de tiempos y pausas
-import sqlite3  # Conexión con la base de datos SQLite
+import sqlite3  # Errores de la base de datos SQLite
+import basedatos  # Esquema de users.db y lectura de las codificaciones
+import instantanea  # Instantáneas de la galería publicadas por web.py
+import avisos  # Avisos de altas y bajas enviados por web.py
+import historial  # Historial local de accesos, intrusiones y bloqueos
+import capturas  # Archivo en disco de las fotos de intrusiones y accesos
 import threading  # Manejo de hilos para tareas concurrentes
-from picamera2 import Picamera2  # Control de la cámara Raspberry Pi
-import requests  # Envío de solicitudes HTTP, usado para la API de Telegram
+import signal  # Parada ordenada cuando el supervisor envía SIGTERM
+import latido  # Latidos para el supervisor (AccesoSeguro.py)
+from notificaciones import Notificador  # Cola de notificaciones a Telegram en segundo plano
+from galeria import Galeria  # Matriz de codificaciones de los usuarios registrados
+import reconocimiento  # Detección, codificación y búsqueda de caras
+from seguimiento import Seguidor  # Seguimiento de caras entre fotogramas
+from captura import CapturaCamara, EtapaReconocimiento, RESULTADO_VACIO  # Captura y reconocimiento desacoplados
+from trabajadores import PoolReconocimiento, EtapaPool  # Reconocimiento en varios núcleos
+from movimiento import CompuertaMovimiento  # Omite los fotogramas sin cambios y adapta el ritmo
+from eventos import MotorEventos  # Eventos GPIO por detección de flancos
+from actuadores import Actuadores, patron_sirena, patron_parpadeo  # Servo, LEDs y buzzer temporizados
 
 # Cargar variables de entorno desde el archivo .env
 load_dotenv()
@@ -26,67 +40,121 @@ LED_BLANCO = 22
 SENSOR_MAGNETICO = 5
 
 # Configuración global
-TOLERANCE = 0.6  # Tolerancia para el reconocimiento facial
-lock_time = None
-empezar_cuenta=1
+TOLERANCE = float(os.getenv("TOLERANCE", "0.6"))  # Tolerancia para el reconocimiento facial (con varias muestras puede ser más estricta)
+GALERIA_CENTROIDES = os.getenv("GALERIA_CENTROIDES", "0") == "1"  # Comparar con el centroide de cada usuario en vez de con sus muestras
+INTERVALO_USUARIOS = 1  # Segundos entre comprobaciones de cambios en la base de datos
+INTERVALO_RESPALDO = 60  # Segundos entre comprobaciones cuando llegan los avisos de web.py
+RESOLUCION = (640, 480)  # Resolución del fotograma usado para codificar las caras
+RESOLUCION_LORES = (320, 240)  # Resolución del flujo lores usado para detectar en modo "lores"
+MODO_DETECCION = os.getenv("MODO_DETECCION", reconocimiento.DETECCION_ESCALADA)  # "completo", "escalado" o "lores"
+ESCALA_DETECCION = float(os.getenv("ESCALA_DETECCION", "0.5"))  # Factor de reducción en modo "escalado"
+UPSAMPLE_DETECCION = int(os.getenv("UPSAMPLE_DETECCION", "1"))  # Veces que HOG amplía la imagen de detección
+# Detectar a 0.5 con upsample 1 es unas cuatro veces más barato que en el fotograma completo, pero
+# solo encuentra caras de unos 80 px o más (a escala completa, unos 40 px): la persona tiene que
+# acercarse más a la cámara. UPSAMPLE_DETECCION=2 recupera los 40 px al coste del fotograma completo.
+INTERVALO_DETECCION = int(os.getenv("INTERVALO_DETECCION", "5"))  # Fotogramas entre detecciones HOG completas
+REFRESCO_IDENTIDAD = float(os.getenv("REFRESCO_IDENTIDAD", "2.0"))  # Segundos antes de recodificar una cara seguida
+MODO_RECONOCIMIENTO = os.getenv("MODO_RECONOCIMIENTO", "hilo")  # "hilo" o "procesos" (pool multinúcleo)
+NUM_TRABAJADORES = int(os.getenv("NUM_TRABAJADORES", str(max((os.cpu_count() or 1) - 1, 1))))  # Procesos del pool
+REPOSO_CAMARA = float(os.getenv("REPOSO_CAMARA", "60"))  # Segundos sin presencia antes de detener la cámara (0: nunca)
+COMPUERTA_MOVIMIENTO = os.getenv("COMPUERTA_MOVIMIENTO", "1") == "1"  # Reconocer solo cuando la escena cambia
+UMBRAL_MOVIMIENTO = int(os.getenv("UMBRAL_MOVIMIENTO", "12"))  # Diferencia de gris que cuenta como cambio en un píxel
+FRACCION_MOVIMIENTO = float(os.getenv("FRACCION_MOVIMIENTO", "0.005"))  # Fracción de píxeles cambiados que cuenta como movimiento
+INDICE_DESDE = int(os.getenv("INDICE_DESDE", "2000"))  # Codificaciones a partir de las que se usa el índice IVF (0: nunca)
+NPROBE_INDICE = int(os.getenv("NPROBE_INDICE", "8"))  # Listas del índice revisadas por consulta
+CAPTURAS_MAX_MB = int(os.getenv("CAPTURAS_MAX_MB", "200"))  # Espacio máximo del archivo de capturas
+CAPTURAS_MAX_DIAS = int(os.getenv("CAPTURAS_MAX_DIAS", "30"))  # Antigüedad máxima de las capturas
+TIEMPO_BLOQUEO = 5  # Segundos con la puerta cerrada antes del bloqueo automático
 servo_unlocked = False  # Indica si el servo está desbloqueado
+galeria = Galeria(TOLERANCE, INDICE_DESDE or None, NPROBE_INDICE)  # Codificaciones de los usuarios registrados
+esquema_galeria = None  # Versión del esquema con la que se cargó la galería
+version_instantanea = None  # Versión de la instantánea cargada (None si se leyó de la base de datos)
+generacion_instantanea = None  # Generación de la base de datos que refleja esa instantánea
+seguidor = Seguidor(INTERVALO_DETECCION, REFRESCO_IDENTIDAD, reloj=reloj)  # Caras seguidas delante de la caja
 
 # Locks para proteger recursos compartidos en hilos
 led_lock = threading.Lock()
-door_lock = threading.Lock()
-camera_lock = threading.Lock()
-buzzer_lock = threading.Lock()
-
-# Configuración de los pines GPIO
-GPIO.setwarnings(False)  # Deshabilitar advertencias
-GPIO.setmode(GPIO.BCM)  # Usar numeración BCM de los pines
-GPIO.setup(SENSOR_PRESENCIA, GPIO.IN)  # Configurar sensor de presencia como entrada
-GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)  # Botón con resistencia pull-up
-GPIO.setup(BUZZER_PIN, GPIO.OUT)  # Buzzer como salida
-GPIO.setup(SERVO_PIN, GPIO.OUT)  # Servo motor como salida
-GPIO.setup(LED_ROJO, GPIO.OUT)  # LED rojo como salida
-GPIO.setup(LED_VERDE, GPIO.OUT)  # LED verde como salida
-GPIO.setup(LED_BLANCO, GPIO.OUT)  # LED blanco como salida
-GPIO.setup(SENSOR_MAGNETICO, GPIO.IN)  # Sensor magnético como entrada
-
-# Configuración del servo motor
-servo = GPIO.PWM(SERVO_PIN, 50)  # Crear PWM en el pin del servo a 50 Hz
-servo.start(0)  # Iniciar PWM con ciclo de trabajo 0
+
+# PWM del servo y del buzzer; se crean en configurar_gpio()
+servo = None
+buzzer = None
+
+# Planificador de servo, LEDs y buzzer (también lleva el bloqueo automático)
+actuadores = Actuadores(reloj)
+
+# Eventos de las entradas: botón, PIR y sensor magnético
+eventos = MotorEventos(GPIO, reloj=reloj)
+presencia = threading.Event()  # Activo mientras el PIR detecta a alguien
+
+# Hilos de captura y reconocimiento, pool de procesos y canal de avisos; se crean en arrancar()
+captura = None
+etapa = None
+pool = None
+receptor = None
+hilo_usuarios = None
+
+# Avisos de altas y bajas: despiertan al hilo de usuarios sin esperar a la siguiente comprobación
+cambios_usuarios = threading.Event()
+
+# Historial de eventos, escrito por lotes desde un hilo propio
+registro = historial.RegistroEventos(reloj=reloj)
+
+# Archivo de capturas: codifica y guarda las fotos en un hilo propio
+archivo_capturas = capturas.ArchivoCapturas(max_mb=CAPTURAS_MAX_MB, max_dias=CAPTURAS_MAX_DIAS, reloj=reloj)
+
+# Notificaciones a Telegram desde un hilo propio con una sesión HTTP reutilizada
+notificador = Notificador(BOT_TOKEN, CHAT_ID)
 
 # Funciones principales
-def send_telegram_message(message):
-    """
-    Envía un mensaje de texto a Telegram.
+def configurar_gpio():
+    """
+    Configura los pines GPIO y los PWM del servo y del buzzer.
+    No se hace al importar el módulo para poder usarlo fuera de la Raspberry Pi.
+    """
+    global servo, buzzer
+    GPIO.setwarnings(False)  # Deshabilitar advertencias
+    GPIO.setmode(GPIO.BCM)  # Usar numeración BCM de los pines
+    GPIO.setup(SENSOR_PRESENCIA, GPIO.IN)  # Configurar sensor de presencia como entrada
+    GPIO.setup(BUTTON_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)  # Botón con resistencia pull-up
+    GPIO.setup(BUZZER_PIN, GPIO.OUT)  # Buzzer como salida
+    GPIO.setup(SERVO_PIN, GPIO.OUT)  # Servo motor como salida
+    GPIO.setup(LED_ROJO, GPIO.OUT)  # LED rojo como salida
+    GPIO.setup(LED_VERDE, GPIO.OUT)  # LED verde como salida
+    GPIO.setup(LED_BLANCO, GPIO.OUT)  # LED blanco como salida
+    GPIO.setup(SENSOR_MAGNETICO, GPIO.IN)  # Sensor magnético como entrada
+
+    # Configuración del servo motor
+    servo = GPIO.PWM(SERVO_PIN, 50)  # Crear PWM en el pin del servo a 50 Hz
+    servo.start(0)  # Iniciar PWM con ciclo de trabajo 0
+
+    # Configuración del buzzer: el tono lo genera el PWM, no bucles con sleep
+    buzzer = GPIO.PWM(BUZZER_PIN, 600)
+    buzzer.start(0)
+
+def send_telegram_message(message, clave=None):
+    """
+    Encola un mensaje de texto para Telegram; nunca espera a la red.
     Utiliza el token y chat ID configurados en el archivo .env.
     """
-    if not BOT_TOKEN or not CHAT_ID:
-        print("Error: BOT_TOKEN o CHAT_ID no configurados.")
-        return
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
-    try:
-        response = requests.post(url, data={"chat_id": CHAT_ID, "text": message})
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Error al enviar mensaje a Telegram: {e}")
+    notificador.mensaje(message, clave)
 
-def send_telegram_photo(frame, caption):
+def send_telegram_photo(frame, caption, clave=None):
     """
-    Envía una foto a Telegram con un pie de foto.
+    Encola una foto con un pie de foto para Telegram; nunca espera a la red.
     """
-    if not BOT_TOKEN or not CHAT_ID:
-        print("Error: BOT_TOKEN o CHAT_ID no configurados.")
-        return
-    url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendPhoto"
-    try:
-        _, buffer = cv2.imencode('.jpg', frame)  # Convertir imagen a formato JPG
-        response = requests.post(
-            url,
-            files={"photo": buffer.tobytes()},
-            data={"chat_id": CHAT_ID, "caption": caption},
-        )
-        response.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"Error al enviar foto a Telegram: {e}")
+    notificador.foto(frame, caption, clave)
+
+def archivar_fotograma(instante, motivo, al_guardar=None):
+    """
+    Guarda en el archivo de capturas el fotograma del instante dado y devuelve
+    su referencia para el historial (None si no hay fotograma). Si la cámara
+    estaba detenida por falta de presencia, la arranca y usa su primer fotograma.
+    La codificación y la escritura se hacen en el hilo del archivo.
+    """
+    fotograma = captura.fotograma_para(instante)
+    if fotograma is None:
+        return None
+    return archivo_capturas.guardar(fotograma.frame, motivo, instante, al_guardar)
 
 def set_led_state(led_rojo=None, led_verde=None, led_blanco=None):
     """
@@ -100,15 +168,23 @@ def set_led_state(led_rojo=None, led_verde=None, led_blanco=None):
         if led_blanco is not None:
             GPIO.output(LED_BLANCO, led_blanco)
 
+def mover_servo(duty_cycle):
+    """
+    Programa un movimiento del servo y su parada un segundo después, sin bloquear.
+    """
+    actuadores.programar(
+        "servo",
+        [(0, lambda: servo.ChangeDutyCycle(duty_cycle)), (1, lambda: servo.ChangeDutyCycle(0))],
+        al_cancelar=lambda: servo.ChangeDutyCycle(0),
+    )
+
 def desbloquear_servo():
     """
     Desbloquea el servo motor.
     """
     global servo_unlocked
     servo_unlocked = True
-    servo.ChangeDutyCycle(12)  # Mover el servo a la posición desbloqueada
-    time.sleep(1)
-    servo.ChangeDutyCycle(0)  # Detener el servo
+    mover_servo(12)  # Mover el servo a la posición desbloqueada
     set_led_state(False, True, None)  # LED verde encendido
 
 def bloquear_servo():
@@ -117,82 +193,117 @@ def bloquear_servo():
     """
     global servo_unlocked
     servo_unlocked = False
-    servo.ChangeDutyCycle(7)  # Mover el servo a la posición bloqueada
-    time.sleep(1)
-    servo.ChangeDutyCycle(0)  # Detener el servo
-    set_led_state(True, False, None)  # LED verde encendido
+    mover_servo(7)  # Mover el servo a la posición bloqueada
+    set_led_state(True, False, None)  # LED rojo encendido
 
 def activate_buzzer(duration=3):
     """
-    Activa el buzzer para sonar como una sirena de policía durante un tiempo específico.
-    """
-    with buzzer_lock:
-        start_time = time.time()
-        while time.time() - start_time < duration:
-            # Simula el sonido de una sirena al alternar frecuencias
-            for _ in range(5):  # Ciclo de subida
-                GPIO.output(BUZZER_PIN, True)
-                time.sleep(0.05)  # Ajusta este valor para cambiar el tono
-                GPIO.output(BUZZER_PIN, False)
-                time.sleep(0.05)
-            for _ in range(5):  # Ciclo de bajada
-                GPIO.output(BUZZER_PIN, True)
-                time.sleep(0.1)  # Ajusta este valor para cambiar el tono
-                GPIO.output(BUZZER_PIN, False)
-                time.sleep(0.1)
+    Activa el buzzer como una sirena de policía durante un tiempo específico
+    y hace parpadear el LED rojo. Vuelve enseguida: el patrón lo ejecuta el planificador.
+    """
+    restaurar_led = lambda: set_led_state(not servo_unlocked, None, None)
+    actuadores.programar("buzzer", patron_sirena(buzzer, duration), al_cancelar=lambda: buzzer.ChangeDutyCycle(0))
+    actuadores.programar(
+        "leds",
+        patron_parpadeo(lambda: set_led_state(True, None, None), lambda: set_led_state(False, None, None), duration, final=restaurar_led),
+        al_cancelar=restaurar_led,
+    )
 
-def detectar_presencia():
+def detener_alarma():
     """
-    Detecta presencia con estabilidad de múltiples lecturas.
+    Detiene la sirena y el parpadeo en curso (por ejemplo, al reconocer a un usuario).
     """
-    return any(GPIO.input(SENSOR_PRESENCIA) for _ in range(5))
+    actuadores.cancelar("buzzer")
+    actuadores.cancelar("leds")
 
-def button_pressed():
+def detectar_presencia():
     """
-    Detecta si el botón ha sido pulsado.
+    Indica si el PIR detecta presencia (último nivel estable, sin leer el GPIO).
     """
-    return GPIO.input(BUTTON_PIN) == GPIO.LOW
+    return bool(eventos.nivel(SENSOR_PRESENCIA))
 
 def sensor_door_open():
     """
-    Detecta si la puerta está abierta con múltiples lecturas estables.
+    Detecta si la puerta está abierta (último nivel estable, sin leer el GPIO).
     """
-    return all(GPIO.input(SENSOR_MAGNETICO) for _ in range(5))
+    return bool(eventos.nivel(SENSOR_MAGNETICO))
 
-def get_users_from_database():
+def cargar_cambios_usuarios(conn, galeria):
     """
-    Carga los usuarios desde la base de datos.
+    Aplica a la galería solo las muestras añadidas y eliminadas de la base de datos.
+    Únicamente se decodifican los BLOB de las muestras nuevas. Si cambia la versión
+    del esquema (por ejemplo, tras la migración) las claves ya no son comparables
+    y se recarga todo.
     """
-    try:
-        with sqlite3.connect("users.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT name, encoding FROM users")
-            rows = cursor.fetchall()
-            return [(row[0], np.frombuffer(row[1], dtype=np.float64)) for row in rows]
-    except sqlite3.Error as e:
-        print(f"Error al cargar usuarios: {e}")
-        return []
+    global esquema_galeria
+    version = basedatos.version_esquema(conn)
+    if version != esquema_galeria:
+        esquema_galeria = version
+        galeria.reemplazar(basedatos.leer_codificaciones(conn, version, centroides=GALERIA_CENTROIDES))
+        print(f"Galería cargada (esquema {version}): {len(galeria)} codificaciones.")
+        return
 
-def process_camera(camera, users):
-    """
-    Procesa la imagen de la cámara y realiza el reconocimiento facial.
-    """
-    try:
-        with camera_lock:
-            frame = camera.capture_array()
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            face_locations = face_recognition.face_locations(rgb_frame)
-            face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-            for face_encoding in face_encodings:
-                matches = face_recognition.compare_faces([user[1] for user in users], face_encoding, tolerance=TOLERANCE)
-                if True in matches:
-                    name = users[matches.index(True)][0]
-                    return name, frame
-            return None, frame
-    except Exception as e:
-        print(f"Error en process_camera: {e}")
-        return None, None
+    actuales = dict(basedatos.listar_claves(conn, version, GALERIA_CENTROIDES))
+    conocidas = galeria.claves()
+    eliminadas = [clave for clave, nombre in conocidas.items() if actuales.get(clave) != nombre]
+    nuevas = [clave for clave, nombre in actuales.items() if conocidas.get(clave) != nombre]
+
+    if not eliminadas and not nuevas and conocidas:
+        # La base de datos cambió pero ninguna fila es nueva ni falta:
+        # se modificó una codificación en el sitio, así que se recarga todo.
+        galeria.reemplazar(basedatos.leer_codificaciones(conn, version, centroides=GALERIA_CENTROIDES))
+        return
+
+    filas = basedatos.leer_codificaciones(conn, version, nuevas, GALERIA_CENTROIDES) if nuevas else []
+    galeria.eliminar(eliminadas)
+    galeria.agregar(filas)
+    if eliminadas or filas:
+        print(f"Usuarios actualizados: {len(filas)} muestras añadidas, {len(eliminadas)} eliminadas.")
+
+def cargar_instantanea():
+    """
+    Si web.py ha publicado una instantánea de la galería más nueva que la cargada,
+    la mapea en memoria y la pone en uso sin decodificar nada. Devuelve True si
+    hay instantánea publicada y refleja la generación actual de la base de datos
+    (y, por tanto, es la fuente de la galería). Si la base de datos cambió después
+    (por ejemplo, falló la publicación) devuelve False y manda la base de datos.
+    """
+    global esquema_galeria, version_instantanea, generacion_instantanea
+    if GALERIA_CENTROIDES:
+        return False  # La instantánea solo contiene las muestras
+    version = instantanea.version_actual()
+    if version is None:
+        return False
+    if version != version_instantanea:
+        esquema, generacion, claves, nombres, matriz, normas = instantanea.cargar(version)
+        if not instantanea.al_dia(generacion, basedatos.conectar()):
+            return False
+        galeria.reemplazar_matriz(claves, nombres, matriz, normas)
+        esquema_galeria, version_instantanea, generacion_instantanea = esquema, version, generacion
+        print(f"Galería cargada de la instantánea {version}: {len(galeria)} codificaciones.")
+        return True
+    return instantanea.al_dia(generacion_instantanea, basedatos.conectar())
+
+def procesar_fotograma(fotograma):
+    """
+    Realiza el reconocimiento facial sobre un fotograma de la cámara.
+    Las caras ya identificadas se siguen entre fotogramas y solo se vuelven a
+    codificar al aparecer o cuando su identidad caduca.
+    Devuelve el usuario más cercano dentro de la tolerancia como (nombre, distancia).
+    """
+    imagen_deteccion = None
+    if fotograma.lores is not None:
+        imagen_deteccion = reconocimiento.luminancia_lores(fotograma.lores, RESOLUCION_LORES)
+    rgb_frame = cv2.cvtColor(fotograma.frame, cv2.COLOR_BGR2RGB)
+    escala = ESCALA_DETECCION if MODO_DETECCION == reconocimiento.DETECCION_ESCALADA else 1.0
+
+    seguidor.actualizar(
+        rgb_frame,
+        lambda imagen: reconocimiento.detectar_caras(imagen, escala, UPSAMPLE_DETECCION, imagen_deteccion),
+        reconocimiento.codificar_caras,
+        galeria,
+    )
+    return seguidor.identificado()
 
 def inicializar_estado():
     """
@@ -213,104 +324,258 @@ def hilo_seguro(func, *args, **kwargs):
     except Exception as e:
         print(f"Error en el hilo {func.__name__}: {e}")
 
-def reconocimiento_facial(camera):
+def publicar_reconocimiento(resultado):
     """
-    Hilo que realiza reconocimiento facial continuamente.
+    Recibe cada resultado de la etapa de reconocimiento y actualiza el LED blanco.
     """
-    global users
-    while True:
-        if detectar_presencia():
-            name, frame = process_camera(camera, users)
-            set_led_state(None, None, name is not None)
-        else:
-            set_led_state(None, None, False)
-        time.sleep(0.1)
+    if resultado is RESULTADO_VACIO:
+        seguidor.reiniciar()
+    elif resultado.nombre is not None:
+        detener_alarma()  # Un usuario autorizado anula la sirena
+    set_led_state(None, None, resultado.nombre is not None)
 
-def monitoreo_boton():
+def al_cambiar_presencia(nivel, instante):
     """
-    Hilo que monitorea las acciones del botón.
+    Manejador del PIR: despierta o duerme la etapa de reconocimiento
+    (y la cámara, si estaba detenida).
     """
-    global servo_unlocked
-    last_pressed_time = 0
-    debounce_time = 0.2
-    while True:
-        if button_pressed():
-            current_time = time.time()
-            if servo_unlocked:
-                continue
-            if current_time - last_pressed_time > debounce_time:
-                last_pressed_time = current_time
-                if GPIO.input(LED_BLANCO):
-                    desbloquear_servo()
-                    set_led_state(False, True, None)
-                    name, frame = process_camera(camera, users)
-                    send_telegram_message(f"✅ Acceso permitido: {name} desbloqueó la caja.")
-                else:
-                    with camera_lock:
-                        frame = camera.capture_array()
-                    send_telegram_message("🚨 Intento no autorizado detectado.")
-                    send_telegram_photo(frame, "🚨 Intruso 🚨")
-                    activate_buzzer()
-
-def verificar_puerta():
-    """
-    Hilo que verifica continuamente el estado de la puerta.
-    Bloquea automáticamente la puerta si:
-    - El servo está desbloqueado
-    - La puerta está cerrada
-    - Han pasado 5 segundos
-    """
-    global lock_time, servo_unlocked, empezar_cuenta
+    if nivel:
+        presencia.set()
+        if captura is not None:
+            captura.despertar()
+    else:
+        presencia.clear()
 
-    while True:
-        door_is_open = sensor_door_open()  # Verificar si la puerta está abierta
-        current_time = time.time()
-
-        # Reiniciar el tiempo si la puerta está abierta
-        if door_is_open:
-            lock_time = None
-            empezar_cuenta=1
-        else:
-            if servo_unlocked:
-                if empezar_cuenta==1:
-                    lock_time=time.time()
-                    empezar_cuenta=0
-                if current_time - lock_time >= 5:  # Han pasado 5 segundos con la puerta cerrada
-                    with door_lock:
-                        bloquear_servo()
-                        send_telegram_message("🔒 Caja bloqueada.")
-                        lock_time = None  # Reiniciar el tiempo de desbloqueo
-                        empezar_cuenta=1
-
-        time.sleep(0.1)
-
-def actualizar_usuarios_periodicamente():
-    """
-    Hilo que actualiza periódicamente la lista de usuarios.
-    """
-    global users
-    while True:
-        users = get_users_from_database()
-        time.sleep(10)
+def al_pulsar_boton(nivel, instante):
+    """
+    Manejador del botón: abre la caja si hay un usuario reconocido o
+    da la alarma si no lo hay.
+    """
+    if nivel != GPIO.LOW or servo_unlocked:
+        return  # Solo interesa la pulsación con la caja bloqueada
+    resultado = etapa.resultado  # Último resultado publicado, sin esperar a la cámara
+    name = resultado.nombre
+    # Se comprueba que siga en la galería por si se dio de baja tras reconocerlo
+    if GPIO.input(LED_BLANCO) and name in galeria.claves().values():
+        desbloquear_servo()
+        set_led_state(False, True, None)
+        programar_bloqueo()
+        send_telegram_message(f"✅ Acceso permitido: {name} desbloqueó la caja.")
+        referencia = archivar_fotograma(instante, historial.ACCESO)
+        registro.registrar(historial.ACCESO, name, resultado.distancia, referencia, instante=instante)
+    else:
+        # Los avisos repetidos que aún no han salido se agrupan en uno
+        send_telegram_message("🚨 Intento no autorizado detectado.", clave="intruso")
+        activate_buzzer()  # Antes de la foto: puede esperar a que arranque la cámara
+        # La foto del momento de la pulsación queda en disco aunque falle el envío;
+        # Telegram recibe el mismo JPG cuando el archivo termina de codificarlo
+        referencia = archivar_fotograma(
+            instante, historial.INTRUSION,
+            al_guardar=lambda jpeg: send_telegram_photo(jpeg, "🚨 Intruso 🚨", clave="intruso_foto"),
+        )
+        registro.registrar(historial.INTRUSION, distancia=resultado.distancia, captura=referencia, instante=instante)
 
-if __name__ == "__main__":
+def programar_bloqueo():
+    """
+    Programa el bloqueo automático si la caja está desbloqueada y la puerta cerrada;
+    en cualquier otro caso cancela el que hubiera pendiente.
+    """
+    if servo_unlocked and not sensor_door_open():
+        actuadores.programar("bloqueo", [(TIEMPO_BLOQUEO, bloqueo_automatico)])
+    else:
+        actuadores.cancelar("bloqueo")
+
+def bloqueo_automatico():
+    """
+    Bloquea automáticamente la puerta si, pasados TIEMPO_BLOQUEO segundos,
+    el servo sigue desbloqueado y la puerta sigue cerrada.
+    Se ejecuta en el hilo de los actuadores, que serializa bloqueos y cancelaciones.
+    """
+    if not servo_unlocked or sensor_door_open():
+        return
+    bloquear_servo()
+    send_telegram_message("🔒 Caja bloqueada.")
+    registro.registrar(historial.BLOQUEO)
+
+def al_cambiar_puerta(nivel, instante):
+    """
+    Manejador del sensor magnético: abrir la puerta cancela el bloqueo
+    automático y cerrarla lo vuelve a programar.
+    """
+    programar_bloqueo()
+
+def al_recibir_aviso(tipo, nombre):
+    """
+    Aviso de alta o baja enviado por web.py. Una baja se aplica en el acto a la
+    galería y al seguidor (que recuerda identidades unos segundos) para revocar
+    el acceso sin esperar a la recarga; después se despierta al hilo de usuarios
+    para que cargue la instantánea nueva.
+    """
+    if tipo == avisos.BAJA:
+        galeria.eliminar([clave for clave, n in galeria.claves().items() if n == nombre])
+        seguidor.reiniciar()
+        if etapa is not None and etapa.resultado.nombre == nombre:
+            set_led_state(None, None, False)
+        print(f"Acceso revocado: {nombre}")
+    cambios_usuarios.set()
+
+def actualizar_usuarios_periodicamente(receptor):
+    """
+    Hilo que mantiene la galería sincronizada con la base de datos.
+    Se despierta con cada aviso de web.py; mientras el canal de avisos funciona
+    solo comprueba cada INTERVALO_RESPALDO segundos, por si se perdió alguno.
+    Cada INTERVALO_USUARIOS segundos mira si el canal sigue activo: si web.py
+    no pudo entregar un aviso, marca el fallo y se vuelve a comprobar cada vez.
+    Si web.py publica instantáneas basta con leer el número de la última y la
+    generación de la base de datos; si no, o si la instantánea se ha quedado
+    atrás, PRAGMA data_version solo cambia cuando otra conexión confirma
+    cambios, así que la comprobación es barata y puede hacerse cada segundo.
+    La conexión de este hilo es siempre la misma (PRAGMA data_version solo tiene
+    sentido dentro de una conexión) y, con WAL, las escrituras de web.py no la bloquean.
+    """
+    conn = basedatos.conectar()
+    data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+    comprobado = reloj.monotonic()
+    while True:
+        avisado = cambios_usuarios.wait(reloj.a_real(INTERVALO_USUARIOS))
+        cambios_usuarios.clear()
+        if not avisado and receptor.activo and reloj.monotonic() - comprobado < INTERVALO_RESPALDO:
+            continue
+        comprobado = reloj.monotonic()
+        try:
+            if cargar_instantanea():
+                continue
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != data_version:
+                data_version = version
+                cargar_cambios_usuarios(conn, galeria)
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"Error al cargar usuarios: {e}")
+
+def arrancar(cronograma=None):
+    """
+    Arranca la caja: GPIO, cámara, galería e hilos, y devuelve el pool de
+    reconocimiento (o None). Con hardware simulado se puede pasar un
+    cronograma de entradas para reproducir.
+    """
+    global captura, etapa, pool, receptor, hilo_usuarios
+    cronometro.marcar("importaciones")
+    if MODO_RECONOCIMIENTO == "procesos":
+        # Se crea antes que la cámara y los hilos para que los trabajadores nazcan limpios.
+        # El pool no usa el flujo lores ni el seguidor: cada trabajador detecta en el fotograma escalado.
+        escala = ESCALA_DETECCION if MODO_DETECCION != reconocimiento.DETECCION_COMPLETA else 1.0
+        pool = PoolReconocimiento(NUM_TRABAJADORES, (RESOLUCION[1], RESOLUCION[0], 3), escala, UPSAMPLE_DETECCION)
+        cronometro.marcar("pool")
+    else:
+        # dlib y sus modelos se cargan mientras se preparan el GPIO, la cámara y la galería
+        reconocimiento.precalentar()
+    if MODO_DETECCION == reconocimiento.DETECCION_COMPLETA:
+        escala = 1.0
+    elif MODO_DETECCION == reconocimiento.DETECCION_LORES and pool is None:
+        escala = RESOLUCION_LORES[0] / RESOLUCION[0]
+    else:
+        escala = ESCALA_DETECCION
+    print(f"Detección de caras a escala {escala:g} con upsample {UPSAMPLE_DETECCION}: "
+          f"caras desde unos {reconocimiento.cara_minima(escala, UPSAMPLE_DETECCION):.0f} px.")
+
+    configurar_gpio()
+    notificador.start()
+    registro.start()
+    archivo_capturas.start()
+    actuadores.start()
+    eventos.registrar(SENSOR_PRESENCIA, al_cambiar_presencia)
+    eventos.registrar(BUTTON_PIN, al_pulsar_boton)
+    eventos.registrar(SENSOR_MAGNETICO, al_cambiar_puerta)
+    if detectar_presencia():
+        presencia.set()
     inicializar_estado()
+    cronometro.marcar("gpio")
 
-    camera = Picamera2()
-    config = camera.create_still_configuration(main={"size": (640, 480)})
+    camera = crear_camara()
+    if MODO_DETECCION == reconocimiento.DETECCION_LORES:
+        config = camera.create_still_configuration(main={"size": RESOLUCION}, lores={"size": RESOLUCION_LORES})
+    else:
+        config = camera.create_still_configuration(main={"size": RESOLUCION})
     camera.configure(config)
     camera.start()
+    cronometro.marcar("camara")
+
+    try:
+        conn = basedatos.conectar()
+        basedatos.preparar(conn)
+        if not cargar_instantanea():
+            cargar_cambios_usuarios(conn, galeria)
+    except (sqlite3.Error, OSError, ValueError) as e:
+        print(f"Error al cargar usuarios: {e}")
+    cronometro.marcar("galeria")
+
+    # Un hilo es el dueño de la cámara y otro reconoce siempre el último fotograma
+    captura = CapturaCamara(camera, lores=pool is None and MODO_DETECCION == reconocimiento.DETECCION_LORES,
+                            presencia=presencia, reposo=REPOSO_CAMARA or None, reloj=reloj)
+    captura.start()
+    compuerta = None
+    if COMPUERTA_MOVIMIENTO:
+        # En modo hilo las caras a la vista son las pistas del seguidor; el pool las cuenta él mismo
+        compuerta = CompuertaMovimiento(umbral=UMBRAL_MOVIMIENTO, fraccion=FRACCION_MOVIMIENTO,
+                                        contar_caras=lambda: len(seguidor.pistas), reloj=reloj)
+    if pool is not None:
+        etapa = EtapaPool(captura, pool, galeria, presencia, al_publicar=publicar_reconocimiento, compuerta=compuerta, reloj=reloj)
+    else:
+        etapa = EtapaReconocimiento(captura, procesar_fotograma, presencia, al_publicar=publicar_reconocimiento,
+                                    compuerta=compuerta, reloj=reloj)
+    etapa.start()
 
-    users = get_users_from_database()
+    eventos.start()  # Los manejadores solo se despachan cuando ya existen la cámara y la etapa
+    receptor = avisos.ReceptorAvisos(al_recibir_aviso)
+    receptor.start()
+    hilo_usuarios = threading.Thread(target=hilo_seguro, args=(actualizar_usuarios_periodicamente, receptor), daemon=True, name="usuarios")
+    hilo_usuarios.start()
+    cronometro.marcar("hilos")
+    cronometro.informe()
 
-    threading.Thread(target=hilo_seguro, args=(reconocimiento_facial, camera), daemon=True).start()
-    threading.Thread(target=hilo_seguro, args=(monitoreo_boton,), daemon=True).start()
-    threading.Thread(target=hilo_seguro, args=(verificar_puerta,), daemon=True).start()
-    threading.Thread(target=hilo_seguro, args=(actualizar_usuarios_periodicamente,), daemon=True).start()
+    if SIMULADO and cronograma:
+        GPIO.reproducir(cronograma)
+    return pool
 
+def hilos_vivos():
+    """
+    Comprueba que siguen vivos los hilos sin los que la caja no funciona: sin el
+    de usuarios la galería se congela y sin el de avisos las bajas no se aplican
+    al momento. Si el socket de avisos no llegó a abrirse no se exige su hilo:
+    reiniciar no lo arreglaría y el hilo de usuarios ya sondea cada segundo.
+    """
+    if receptor is None or (receptor.abierto and not receptor.is_alive()):
+        return False
+    return all(hilo is not None and hilo.is_alive() for hilo in (eventos, actuadores, captura, etapa, hilo_usuarios))
+
+def terminar(signum, frame):
+    """
+    Manejador de SIGTERM: sale por el mismo camino que Ctrl+C para liberar el GPIO.
+    """
+    raise KeyboardInterrupt
+
+def detener(pool):
+    """
+    Libera el pool de reconocimiento y los pines GPIO.
+    """
+    if pool is not None:
+        pool.detener()
+    GPIO.cleanup()
+
+if __name__ == "__main__":
+    ruta = os.getenv("CRONOGRAMA_GPIO")
+    cronograma = None
+    if SIMULADO and ruta:
+        from simulacion import cargar_cronograma
+        cronograma = cargar_cronograma(ruta, {"presencia": SENSOR_PRESENCIA, "boton": BUTTON_PIN, "puerta": SENSOR_MAGNETICO})
+    # Antes de preparar el GPIO y el pool: un SIGTERM durante el arranque también los libera
+    signal.signal(signal.SIGTERM, terminar)
     try:
+        arrancar(cronograma)
         while True:
-            time.sleep(0.1)
+            reloj.sleep(1)
+            if hilos_vivos():
+                latido.latir("caja")  # Sin latido, el supervisor reinicia la caja
     except KeyboardInterrupt:
         print("Finalizando programa.")
-        GPIO.cleanup()
+        detener(pool)
@@ -0,0 +1,255 @@
+import collections  # Estructuras de datos (deque para el búfer circular)
+import threading  # Manejo de hilos para tareas concurrentes
+from reloj import RelojReal
+
+# Fotograma capturado: número de secuencia, instante de captura y arrays de la cámara
+Fotograma = collections.namedtuple("Fotograma", ["seq", "instante", "frame", "lores"])
+
+# Resultado publicado por la etapa de reconocimiento
+Resultado = collections.namedtuple("Resultado", ["seq", "instante", "nombre", "distancia"])
+RESULTADO_VACIO = Resultado(-1, 0.0, None, None)
+
+
+class Metricas:
+    """
+    Mide el rendimiento del reconocimiento durante cada episodio de presencia:
+    fotogramas procesados por segundo, latencia desde el disparo del PIR
+    hasta el primer resultado y fotogramas omitidos por la compuerta de movimiento.
+    """
+
+    def __init__(self, nombre, reloj=None):
+        self.nombre = nombre
+        self.reloj = reloj or RelojReal()
+        self.inicio = None
+        self.primer_resultado = None
+        self.procesados = 0
+        self.omitidos = 0
+
+    def inicio_presencia(self):
+        self.inicio = self.reloj.time()
+        self.primer_resultado = None
+        self.procesados = 0
+        self.omitidos = 0
+
+    def omitido(self):
+        self.omitidos += 1
+
+    def resultado(self):
+        if self.primer_resultado is None:
+            self.primer_resultado = self.reloj.time()
+        self.procesados += 1
+
+    def resumen(self):
+        """
+        Devuelve (fotogramas por segundo, latencia del primer resultado) del episodio actual.
+        """
+        if self.inicio is None or self.primer_resultado is None:
+            return 0.0, None
+        duracion = self.reloj.time() - self.inicio
+        return self.procesados / duracion if duracion > 0 else 0.0, self.primer_resultado - self.inicio
+
+    def fin_presencia(self):
+        fps, latencia = self.resumen()
+        if latencia is not None:
+            print(
+                f"Reconocimiento ({self.nombre}): {fps:.1f} fps, primer resultado a {latencia * 1000:.0f} ms del PIR, "
+                f"{self.procesados} fotogramas procesados y {self.omitidos} omitidos sin movimiento."
+            )
+        self.inicio = None
+
+
+class CapturaCamara(threading.Thread):
+    """
+    Hilo productor que es el único dueño de la cámara.
+    Escribe los fotogramas en un búfer circular pequeño con su instante de captura.
+    Los demás hilos leen el último fotograma sin bloquearse.
+
+    Con `presencia` y `reposo`, la cámara se detiene tras `reposo` segundos sin
+    presencia y vuelve a arrancar con despertar() (flanco del PIR o pulsación
+    del botón). Se detiene con
+    stop() sin cerrarla, así que conserva la configuración y el arranque solo
+    pone en marcha el sensor. `arranques` guarda los últimos tiempos desde el
+    aviso hasta el primer fotograma.
+    """
+
+    def __init__(self, camera, capacidad=4, lores=False, presencia=None, reposo=None, reloj=None):
+        super().__init__(daemon=True, name="captura")
+        self.camera = camera
+        self.reloj = reloj or RelojReal()
+        self.lores = lores  # Capturar también el flujo lores
+        self.presencia = presencia  # threading.Event activo mientras el PIR detecta a alguien
+        self.reposo = reposo  # Segundos sin presencia antes de detener la cámara (None: nunca)
+        self.arranques = collections.deque(maxlen=50)
+        self.encendida = True
+        self._despertar = threading.Event()
+        self._buffer = collections.deque(maxlen=capacidad)
+        self._condicion = threading.Condition()
+        self._activa = True
+        self.ultimo = None  # Último fotograma; asignar una referencia es atómico
+
+    def run(self):
+        seq = 0
+        sin_presencia = None  # Instante (monotónico) en que dejó de haber presencia
+        despertada = None  # Instante del aviso que volvió a arrancar la cámara
+        while self._activa:
+            if self.reposo is not None and self.presencia is not None:
+                if self.presencia.is_set():
+                    sin_presencia = None
+                elif sin_presencia is None:
+                    sin_presencia = self.reloj.monotonic()
+                elif self.reloj.monotonic() - sin_presencia >= self.reposo:
+                    self._despertar.clear()
+                    if self.presencia.is_set():
+                        continue  # Llegó alguien justo ahora
+                    self._apagar()
+                    self._despertar.wait()  # Dormir hasta el siguiente aviso
+                    despertada = self.reloj.time()
+                    sin_presencia = None
+                    self._encender()
+                    continue
+            try:
+                if self.lores:
+                    (frame, lores), _ = self.camera.capture_arrays(["main", "lores"])
+                else:
+                    frame, lores = self.camera.capture_array(), None
+            except Exception as e:
+                print(f"Error al capturar fotograma: {e}")
+                self.reloj.sleep(0.5)
+                continue
+            fotograma = Fotograma(seq, self.reloj.time(), frame, lores)
+            seq += 1
+            with self._condicion:
+                self._buffer.append(fotograma)
+                self.ultimo = fotograma
+                self._condicion.notify_all()
+            if despertada is not None:
+                self.arranques.append(fotograma.instante - despertada)
+                print(f"Cámara encendida: primer fotograma a {(fotograma.instante - despertada) * 1000:.0f} ms del aviso.")
+                despertada = None
+
+    def _apagar(self):
+        """
+        Detiene el sensor y olvida los fotogramas, que ya no son del momento actual.
+        """
+        try:
+            self.camera.stop()
+        except Exception as e:
+            print(f"Error al detener la cámara: {e}")
+        with self._condicion:
+            self._buffer.clear()
+            self.ultimo = None
+        self.encendida = False
+        print("Cámara detenida por falta de presencia.")
+
+    def _encender(self):
+        try:
+            self.camera.start()  # La configuración se conserva desde el arranque
+        except Exception as e:
+            print(f"Error al arrancar la cámara: {e}")
+        self.encendida = True
+
+    def despertar(self):
+        """
+        Vuelve a arrancar la cámara si está detenida. Se puede llamar desde cualquier hilo.
+        """
+        self._despertar.set()
+
+    def fotograma_para(self, instante, timeout=2.0):
+        """
+        Como fotograma_en, pero si la cámara estaba detenida la arranca y espera
+        su primer fotograma (None si no llega antes del timeout).
+        """
+        fotograma = self.fotograma_en(instante)
+        if fotograma is None:
+            self.despertar()
+            fotograma = self.esperar_nuevo(-1, timeout)
+        return fotograma
+
+    def detener(self):
+        self._activa = False
+
+    def fotograma_en(self, instante):
+        """
+        Devuelve el fotograma del búfer más cercano al instante indicado.
+        """
+        fotogramas = list(self._buffer)
+        if not fotogramas:
+            return None
+        return min(fotogramas, key=lambda f: abs(f.instante - instante))
+
+    def esperar_nuevo(self, seq_anterior, timeout=1.0):
+        """
+        Espera a que haya un fotograma más reciente que seq_anterior y lo devuelve.
+        Devuelve None si no llega ninguno antes del timeout.
+        """
+        with self._condicion:
+            self._condicion.wait_for(lambda: self.ultimo is not None and self.ultimo.seq > seq_anterior, timeout)
+            if self.ultimo is None or self.ultimo.seq <= seq_anterior:
+                return None
+            return self.ultimo
+
+
+class EtapaReconocimiento(threading.Thread):
+    """
+    Hilo consumidor que procesa siempre el fotograma más reciente y publica el resultado.
+    Los fotogramas que llegan mientras se procesa otro se descartan.
+    procesar(fotograma) devuelve (nombre, distancia); solo se reconoce mientras presencia esté activo.
+    Con una compuerta (movimiento.CompuertaMovimiento) se omiten los fotogramas
+    sin cambios y el intervalo entre reconocimientos lo decide ella.
+    """
+
+    def __init__(self, captura, procesar, presencia, intervalo=0.1, al_publicar=None, compuerta=None, reloj=None):
+        super().__init__(daemon=True, name="reconocimiento")
+        self.reloj = reloj or RelojReal()
+        self.captura = captura
+        self.procesar = procesar
+        self.presencia = presencia  # threading.Event activo mientras el PIR detecta a alguien
+        self.intervalo = intervalo  # Tiempo mínimo entre reconocimientos
+        self.al_publicar = al_publicar  # Función opcional llamada con cada resultado
+        self.compuerta = compuerta
+        self.resultado = RESULTADO_VACIO
+        self.metricas = Metricas("hilo", self.reloj)
+
+    def run(self):
+        seq = -1
+        presente = False
+        while True:
+            if not self.presencia.is_set():
+                if presente:
+                    presente = False
+                    self.metricas.fin_presencia()
+                self._publicar(RESULTADO_VACIO)
+                self.presencia.wait()  # Dormir hasta el siguiente flanco del PIR
+                continue
+            if not presente:
+                presente = True
+                self.metricas.inicio_presencia()
+                if self.compuerta is not None:
+                    self.compuerta.inicio_presencia()
+            fotograma = self.captura.esperar_nuevo(seq)
+            if fotograma is None:
+                continue
+            seq = fotograma.seq
+            if self.compuerta is not None and not self.compuerta.debe_procesar(fotograma):
+                self.metricas.omitido()  # La escena no ha cambiado: sigue valiendo el último resultado
+                continue
+            inicio = self.reloj.time()
+            try:
+                nombre, distancia = self.procesar(fotograma)
+            except Exception as e:
+                print(f"Error en el reconocimiento: {e}")
+                nombre, distancia = None, None
+            self.metricas.resultado()
+            self._publicar(Resultado(fotograma.seq, fotograma.instante, nombre, distancia))
+            intervalo = self.intervalo
+            if self.compuerta is not None:
+                self.compuerta.resultado(nombre)
+                intervalo = self.compuerta.intervalo()
+            espera = intervalo - (self.reloj.time() - inicio)
+            if espera > 0:
+                self.reloj.sleep(espera)
+
+    def _publicar(self, resultado):
+        self.resultado = resultado
+        if self.al_publicar:
+            self.al_publicar(resultado)
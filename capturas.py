@@ -0,0 +1,144 @@
+import itertools  # Contador para que dos capturas del mismo instante no coincidan
+import os
+import queue  # Colas seguras entre hilos
+import threading  # Manejo de hilos para tareas concurrentes
+import time  # Nombres de archivo y antigüedad de las capturas
+from reloj import RelojReal
+
+DIRECTORIO = os.getenv("CAPTURAS_DIR", "capturas")  # Carpeta del archivo de capturas
+SUFIJO_MINIATURA = "_mini.jpg"
+LIMPIEZA = 3600  # Segundos entre limpiezas por antigüedad cuando no llegan capturas
+
+
+def ruta_captura(referencia, miniatura=False, directorio=DIRECTORIO):
+    return os.path.join(directorio, referencia + (SUFIJO_MINIATURA if miniatura else ".jpg"))
+
+
+def listar(directorio=DIRECTORIO, antes_de=None, limite=24):
+    """
+    Referencias de las capturas de la más reciente a la más antigua. Los nombres
+    empiezan por la fecha, así que el orden alfabético es el cronológico.
+    `antes_de` es la última referencia de la página anterior.
+    """
+    try:
+        nombres = os.listdir(directorio)
+    except FileNotFoundError:
+        return []
+    referencias = sorted(
+        (n[:-len(SUFIJO_MINIATURA)] for n in nombres if n.endswith(SUFIJO_MINIATURA)), reverse=True
+    )
+    if antes_de is not None:
+        referencias = [r for r in referencias if r < antes_de]
+    return referencias[:limite]
+
+
+class ArchivoCapturas(threading.Thread):
+    """
+    Archivo en disco de las fotos de intrusiones y accesos. guardar() solo
+    encola el fotograma y devuelve al momento la referencia con la que se
+    guardará; un hilo propio lo codifica en JPEG, escribe también una miniatura
+    y borra las capturas más antiguas cuando el archivo supera `max_mb` o tienen
+    más de `max_dias`, así que la tarjeta SD nunca se llena. La antigüedad se
+    revisa también cada LIMPIEZA segundos aunque no llegue ninguna captura.
+    """
+
+    def __init__(self, directorio=DIRECTORIO, max_mb=200, max_dias=30, calidad=85, ancho_miniatura=160, capacidad=20, reloj=None):
+        super().__init__(daemon=True, name="capturas")
+        self.directorio = directorio
+        self.max_bytes = max_mb * 1024 * 1024
+        self.max_segundos = max_dias * 86400
+        self.calidad = calidad
+        self.ancho_miniatura = ancho_miniatura
+        self.reloj = reloj or RelojReal()
+        self.descartadas = 0
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._contador = itertools.count()
+        self._capturas = []  # (referencia, bytes, instante) de la más antigua a la más reciente
+        self._total = 0
+
+    def guardar(self, frame, motivo, instante=None, al_guardar=None):
+        """
+        Encola un fotograma BGR y devuelve su referencia (o None si la cola está llena).
+        al_guardar(datos_jpeg) se llama desde el hilo del archivo con el JPEG ya
+        codificado, por ejemplo para enviarlo por Telegram sin codificarlo otra vez.
+        """
+        instante = instante if instante is not None else self.reloj.time()
+        fecha = time.strftime("%Y%m%d-%H%M%S", time.localtime(instante))
+        referencia = f"{fecha}-{int(instante * 1000) % 1000:03d}-{next(self._contador) % 1000:03d}-{motivo}"
+        try:
+            self._cola.put_nowait((referencia, frame, instante, al_guardar))
+        except queue.Full:
+            self.descartadas += 1
+            print(f"Cola de capturas llena, se descarta: {referencia}")
+            return None
+        return referencia
+
+    def run(self):
+        os.makedirs(self.directorio, exist_ok=True)
+        self._cargar_existentes()
+        while True:
+            try:
+                referencia, frame, instante, al_guardar = self._cola.get(timeout=LIMPIEZA)
+            except queue.Empty:
+                self._limpiar()
+                continue
+            try:
+                datos, tamano = self._escribir(referencia, frame)
+                self._capturas.append((referencia, tamano, instante))
+                self._total += tamano
+                self._limpiar()
+            except Exception as e:
+                print(f"Error al guardar la captura {referencia}: {e}")
+                continue
+            if al_guardar is not None:
+                try:
+                    al_guardar(datos)
+                except Exception as e:
+                    print(f"Error tras guardar la captura {referencia}: {e}")
+
+    def _escribir(self, referencia, frame):
+        """
+        Codifica la captura y su miniatura y las escribe.
+        Devuelve el JPEG completo y los bytes que ocupan ambos archivos.
+        """
+        import cv2  # Solo lo necesita caja.py; web.py usa este módulo sin cargar OpenCV
+        _, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.calidad])
+        alto, ancho = frame.shape[:2]
+        miniatura = cv2.resize(frame, (self.ancho_miniatura, max(alto * self.ancho_miniatura // ancho, 1)), interpolation=cv2.INTER_AREA)
+        _, jpeg_miniatura = cv2.imencode(".jpg", miniatura, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        datos = jpeg.tobytes()
+        # La miniatura se escribe la última: el listado solo muestra capturas completas
+        for ruta, contenido in ((ruta_captura(referencia, False, self.directorio), datos),
+                                (ruta_captura(referencia, True, self.directorio), jpeg_miniatura.tobytes())):
+            with open(ruta + ".tmp", "wb") as archivo:
+                archivo.write(contenido)
+            os.replace(ruta + ".tmp", ruta)
+        return datos, len(datos) + len(jpeg_miniatura)
+
+    def _cargar_existentes(self):
+        """
+        Recupera las capturas de ejecuciones anteriores para respetar los límites.
+        """
+        for referencia in sorted(listar(self.directorio, limite=None)):
+            try:
+                estado = os.stat(ruta_captura(referencia, False, self.directorio))
+                tamano = estado.st_size + os.path.getsize(ruta_captura(referencia, True, self.directorio))
+            except OSError:
+                continue
+            self._capturas.append((referencia, tamano, estado.st_mtime))
+            self._total += tamano
+        self._limpiar()
+
+    def _limpiar(self):
+        """
+        Borra las capturas más antiguas mientras se supere el tamaño o la antigüedad máxima.
+        """
+        limite = self.reloj.time() - self.max_segundos
+        while self._capturas and (self._total > self.max_bytes or self._capturas[0][2] < limite):
+            referencia, tamano, _ = self._capturas.pop(0)
+            self._total -= tamano
+            for miniatura in (True, False):
+                try:
+                    os.remove(ruta_captura(referencia, miniatura, self.directorio))
+                except OSError:
+                    pass
@@ -0,0 +1,37 @@
+import io  # Imágenes decodificadas en memoria, sin archivos temporales
+import os
+
+# Funciones que ejecutan los procesos del pool de altas (altas.GestorAltas).
+# Los procesos se crean con "spawn" e importan este módulo por su nombre, así
+# que aquí no debe haber nada que tenga efectos al importarse: ni la aplicación
+# web, ni conexiones, ni modelos.
+
+
+def inicializar_proceso():
+    """
+    Inicializador de cada proceso del pool. AccesoSeguro.py fija el servidor web
+    a un núcleo (NUCLEOS_WEB) y le baja la prioridad (NICE_WEB), y los procesos
+    lo heredan: se devuelven a todos los núcleos para que las altas masivas
+    codifiquen en paralelo de verdad, y a la prioridad normal si se puede.
+    """
+    try:
+        os.sched_setaffinity(0, range(os.cpu_count() or 1))
+    except (AttributeError, OSError) as e:
+        print(f"No se pudo restablecer la afinidad del proceso de altas: {e}")
+    try:
+        os.setpriority(os.PRIO_PROCESS, 0, 0)
+    except (AttributeError, OSError):
+        pass  # Sin privilegios el nice solo puede subir: se queda el del servidor, que cede ante caja.py
+
+
+def codificar_imagen(datos):
+    """
+    Decodifica la imagen en memoria y devuelve la codificación de la primera
+    cara, o None si no hay ninguna. La primera llamada de cada proceso importa
+    face_recognition (dlib y sus modelos); las siguientes ya lo tienen cargado.
+    """
+    import face_recognition  # Reconocimiento facial
+
+    imagen = face_recognition.load_image_file(io.BytesIO(datos))
+    face_encodings = face_recognition.face_encodings(imagen)
+    return face_encodings[0] if face_encodings else None
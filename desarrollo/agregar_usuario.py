@@ -1,11 +1,19 @@
 from picamera2 import Picamera2
 import face_recognition
 import sqlite3
-import numpy as np
 import cv2
 from time import sleep
 import libcamera
 import requests
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import basedatos  # noqa: E402
+import instantanea  # noqa: E402
+import avisos  # noqa: E402
+
+MUESTRAS = 3  # Fotos que se capturan por usuario; cada una se guarda como una muestra
 
 # CONFIGURACION TELEGRAM
 BOT_TOKEN = "XXX"  # Reemplaza con tu TOKEN
@@ -25,13 +33,9 @@ def send_telegram_message(message):
 
 # Verificar si el nombre existe en la base de datos
 def is_name_taken(name):
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute("CREATE TABLE IF NOT EXISTS users (name TEXT UNIQUE, encoding BLOB)")
-    c.execute("SELECT name FROM users WHERE name = ?", (name,))
-    exists = c.fetchone() is not None
-    conn.close()
-    return exists
+    conn = basedatos.conectar()
+    basedatos.preparar(conn)
+    return conn.execute("SELECT 1 FROM users WHERE name = ?", (name,)).fetchone() is not None
 
 # Configuración de la cámara
 def initialize_camera():
@@ -81,34 +85,36 @@ def capture_face_image(camera):
             print("Captura cancelada por el usuario.")
             return None
 
-# Procesar la imagen y guardar el encoding en la base de datos
-def add_user_to_database(name, frame):
-    # Procesar la imagen en memoria
-    face_encodings = face_recognition.face_encodings(frame)
-
-    if not face_encodings:
-        print("No se detectó ninguna cara en la imagen capturada. Registro fallido.")
+# Procesar las imágenes y guardar sus encodings en la base de datos
+def add_user_to_database(name, frames):
+    # Procesar las imágenes en memoria
+    encodings = []
+    for frame in frames:
+        face_encodings = face_recognition.face_encodings(frame)
+        if face_encodings:
+            encodings.append(face_encodings[0])  # Obtener el primer encoding de cada imagen
+
+    if not encodings:
+        print("No se detectó ninguna cara en las imágenes capturadas. Registro fallido.")
         return False
 
-    encoding = face_encodings[0]  # Obtener el primer encoding
-
-    # Guardar el encoding en la base de datos
-    conn = sqlite3.connect('users.db')
-    c = conn.cursor()
-    c.execute("CREATE TABLE IF NOT EXISTS users (name TEXT UNIQUE, encoding BLOB)")
+    # Guardar el usuario y sus muestras en la base de datos
+    conn = basedatos.conectar()
+    basedatos.preparar(conn)
 
     try:
-        c.execute("INSERT INTO users (name, encoding) VALUES (?, ?)", (name, encoding.tobytes()))
+        basedatos.insertar_usuario(conn, name, None, encodings)
         conn.commit()
-        print(f"Usuario '{name}' agregado correctamente a la base de datos.")
+        instantanea.publicar(conn)  # caja.py carga la galería de la instantánea si existe
+        avisos.enviar(avisos.ALTA, name)
+        print(f"Usuario '{name}' agregado correctamente a la base de datos con {len(encodings)} muestras.")
 
         # Enviar mensaje a Telegram
         send_telegram_message(f"✅ Nuevo usuario agregado: {name}")
     except sqlite3.IntegrityError:
+        conn.rollback()
         print(f"Error: El usuario '{name}' ya existe.")
         send_telegram_message(f"⚠️ Intento de agregar usuario duplicado: {name}")
-    finally:
-        conn.close()
 
     return True
 
@@ -128,9 +134,15 @@ if __name__ == "__main__":
     sleep(1)  # Dar tiempo para estabilizar la cámara
 
     try:
-        frame = capture_face_image(camera)
-        if frame is not None:
-            add_user_to_database(name, frame)
+        frames = []
+        while len(frames) < MUESTRAS:
+            print(f"Muestra {len(frames) + 1} de {MUESTRAS}. Cambia ligeramente la posición de la cabeza.")
+            frame = capture_face_image(camera)
+            if frame is None:
+                break
+            frames.append(frame)
+        if frames:
+            add_user_to_database(name, frames)
         else:
             print("No se completó la captura.")
     except Exception as e:
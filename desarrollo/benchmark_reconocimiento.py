@@ -0,0 +1,256 @@
+# Benchmark del ciclo de reconocimiento sobre fotogramas grabados.
+# Ejecuta el mismo código que caja.py (reconocimiento.py y galeria.py) y mide
+# cada etapa: conversión de color, face_locations, face_encodings y búsqueda en
+# galerías sintéticas de distinto tamaño. Con --indice mide también la búsqueda
+# con el índice IVF (latencia, recall y rechazos falsos frente a la búsqueda
+# exacta, también con consultas cerca de la tolerancia). Guarda los
+# resultados en JSON para poder compararlos entre commits.
+#
+# Uso: python desarrollo/benchmark_reconocimiento.py carpeta_fotogramas \
+#          --tamanos 10,100,1000,10000,100000 --salida bench.json [--indice 8] [--comparar anterior.json]
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import reconocimiento  # noqa: E402
+from galeria import Galeria, DIMENSION, TIPO  # noqa: E402
+
+PERCENTILES = (50, 95, 99)
+
+
+def cargar_fotogramas(carpeta, resolucion):
+    """
+    Carga los fotogramas grabados en BGR a la resolución de la cámara.
+    """
+    fotogramas = []
+    for ruta in sorted(glob.glob(os.path.join(carpeta, "*"))):
+        imagen = cv2.imread(ruta)
+        if imagen is not None:
+            fotogramas.append(cv2.resize(imagen, resolucion))
+    return fotogramas
+
+
+def galeria_sintetica(tamano, reales, semilla=0, nprobe=None):
+    """
+    Galería con `tamano` codificaciones aleatorias de escala parecida a las de
+    face_recognition, más las codificaciones reales de los fotogramas para que
+    también se mida el caso en que hay coincidencia. Con `nprobe` la galería
+    usa el índice IVF sea cual sea su tamaño.
+    """
+    rng = np.random.default_rng(semilla)
+    aleatorias = rng.normal(0.0, 0.09, size=(max(tamano - len(reales), 0), DIMENSION))
+    filas = [(i, f"sintetico_{i}", codificacion) for i, codificacion in enumerate(aleatorias)]
+    filas += [(len(filas) + i, f"real_{i}", codificacion) for i, codificacion in enumerate(reales)]
+    galeria = Galeria(indice_desde=1, nprobe=nprobe) if nprobe else Galeria()
+    galeria.reemplazar(filas)
+    return galeria
+
+
+def medir_indice(galeria, consultas):
+    """
+    Latencia por consulta de la búsqueda con índice (sola y dentro de
+    Galeria.buscar, que repasa en exacto los rechazos) y exacta; recall@1 del
+    índice (fracción de consultas en que devuelve la misma fila que la búsqueda
+    exacta) y rechazos falsos: consultas que la búsqueda exacta acepta dentro de
+    la tolerancia y el índice solo, o buscar(), rechazan.
+    """
+    _, _, matriz, normas, indice = galeria._estado
+    con_indice, con_respaldo, exacta = [], [], []
+    aciertos = rechazos_indice = rechazos_buscar = 0
+    for consulta in consultas:
+        consulta = consulta[None, :]
+        inicio = time.perf_counter()
+        filas, distancias_indice = indice.buscar(consulta, matriz, normas)
+        con_indice.append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        nombre, _ = galeria.buscar(consulta)[0]
+        con_respaldo.append(time.perf_counter() - inicio)
+        inicio = time.perf_counter()
+        distancias = galeria.distancias(consulta)
+        exacta.append(time.perf_counter() - inicio)
+        mejor = int(np.argmin(distancias[0]))
+        aciertos += filas[0] == mejor
+        if distancias[0, mejor] <= galeria.tolerancia:
+            rechazos_indice += filas[0] == -1 or distancias_indice[0] > galeria.tolerancia
+            rechazos_buscar += nombre is None
+    return {
+        "indice": resumen(con_indice),
+        "buscar": resumen(con_respaldo),
+        "exacta": resumen(exacta),
+        "recall": aciertos / len(consultas),
+        "rechazos_falsos_indice": rechazos_indice / len(consultas),
+        "rechazos_falsos_buscar": rechazos_buscar / len(consultas),
+    }
+
+
+def consultas_a_distancia(matriz, cantidad, distancia, rng):
+    """
+    Filas de la galería desplazadas en una dirección aleatoria exactamente
+    `distancia`: con una distancia cercana a la tolerancia son las consultas en
+    las que un índice aproximado puede rechazar a un usuario registrado.
+    """
+    consultas = matriz[rng.integers(0, len(matriz), cantidad)].astype(np.float64)
+    direcciones = rng.normal(0.0, 1.0, size=consultas.shape)
+    direcciones /= np.linalg.norm(direcciones, axis=1, keepdims=True)
+    return (consultas + distancia * direcciones).astype(TIPO)
+
+
+def resumen(tiempos):
+    """
+    Media y percentiles de una lista de tiempos en segundos, en milisegundos.
+    """
+    valores = np.asarray(tiempos) * 1000.0
+    datos = {"media_ms": float(valores.mean()), "n": int(valores.size)}
+    for p in PERCENTILES:
+        datos[f"p{p}_ms"] = float(np.percentile(valores, p))
+    return datos
+
+
+def rss_maximo_mb():
+    """
+    Pico de memoria residente del proceso hasta ahora (ru_maxrss está en KiB en Linux).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def commit_actual():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def medir(fotogramas, tamanos, escala, upsample, repeticiones, nprobe=None, consultas_indice=200):
+    """
+    Mide las etapas de cada fotograma y la búsqueda para cada tamaño de galería.
+    Con `nprobe` añade la comparación entre el índice IVF y la búsqueda exacta,
+    consultando con filas de la galería perturbadas con ruido pequeño.
+    """
+    etapas = {"conversion": [], "face_locations": [], "face_encodings": []}
+    codificaciones_por_fotograma = []
+    base_por_fotograma = []
+    for _ in range(repeticiones):
+        for frame in fotogramas:
+            inicio = time.perf_counter()
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            t_conversion = time.perf_counter()
+            cajas = reconocimiento.detectar_caras(rgb_frame, escala, upsample)
+            t_deteccion = time.perf_counter()
+            face_encodings = reconocimiento.codificar_caras(rgb_frame, cajas)
+            t_codificacion = time.perf_counter()
+
+            etapas["conversion"].append(t_conversion - inicio)
+            etapas["face_locations"].append(t_deteccion - t_conversion)
+            etapas["face_encodings"].append(t_codificacion - t_deteccion)
+            codificaciones_por_fotograma.append(face_encodings)
+            base_por_fotograma.append(t_codificacion - inicio)
+
+    reales = [c for codificaciones in codificaciones_por_fotograma[:len(fotogramas)] for c in codificaciones]
+    resultados = {"etapas": {nombre: resumen(tiempos) for nombre, tiempos in etapas.items()}, "galerias": {}}
+    for tamano in tamanos:
+        galeria = galeria_sintetica(tamano, reales)
+        busquedas, totales = [], []
+        for face_encodings, base in zip(codificaciones_por_fotograma, base_por_fotograma):
+            inicio = time.perf_counter()
+            galeria.buscar(face_encodings)
+            busqueda = time.perf_counter() - inicio
+            busquedas.append(busqueda)
+            totales.append(base + busqueda)
+        resultados["galerias"][str(tamano)] = {
+            "emparejamiento": resumen(busquedas),
+            "fotograma": resumen(totales),
+            "rss_maximo_mb": rss_maximo_mb(),
+        }
+        del galeria
+
+        if nprobe:
+            inicio = time.perf_counter()
+            galeria = galeria_sintetica(tamano, reales, nprobe=nprobe)
+            construccion = time.perf_counter() - inicio
+            rng = np.random.default_rng(1)
+            matriz = galeria._estado[2]
+            consultas = matriz[rng.integers(0, len(matriz), consultas_indice)]
+            consultas = (consultas + rng.normal(0.0, 0.02, size=consultas.shape)).astype(TIPO)
+            indice = medir_indice(galeria, consultas)
+            # Las consultas con poco ruido caen muy dentro de la tolerancia; las del
+            # límite son las que pueden acabar en un rechazo falso
+            limite = consultas_a_distancia(matriz, consultas_indice, 0.9 * galeria.tolerancia, rng)
+            indice["limite"] = medir_indice(galeria, limite)
+            indice["construccion_s"] = construccion
+            resultados["galerias"][str(tamano)]["ivf"] = indice
+            del galeria
+    return resultados
+
+
+def comparar(actual, anterior):
+    """
+    Muestra la variación de p50/p95 por etapa y tamaño de galería respecto a otro informe.
+    """
+    print(f"\nComparación con {anterior.get('commit')}:")
+    filas = [(f"etapa {n}", actual["etapas"][n], anterior["etapas"].get(n)) for n in actual["etapas"]]
+    for t, g in actual["galerias"].items():
+        previa = anterior["galerias"].get(t, {})
+        filas.append((f"emparejamiento galería {t}", g["emparejamiento"], previa.get("emparejamiento")))
+        filas.append((f"fotograma galería {t}", g["fotograma"], previa.get("fotograma")))
+        if "ivf" in g:
+            filas.append((f"índice IVF galería {t}", g["ivf"]["indice"], previa.get("ivf", {}).get("indice")))
+            filas.append((f"buscar con índice galería {t}", g["ivf"]["buscar"], previa.get("ivf", {}).get("buscar")))
+    for nombre, nuevo, viejo in filas:
+        if not viejo:
+            continue
+        cambios = ", ".join(
+            f"p{p} {viejo[f'p{p}_ms']:.2f} -> {nuevo[f'p{p}_ms']:.2f} ms ({100 * (nuevo[f'p{p}_ms'] / viejo[f'p{p}_ms'] - 1):+.1f}%)"
+            for p in (50, 95) if viejo[f"p{p}_ms"] > 0
+        )
+        print(f"  {nombre}: {cambios}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de reconocimiento facial")
+    parser.add_argument("fotogramas", help="Carpeta con los fotogramas grabados")
+    parser.add_argument("--tamanos", default="10,100,1000,10000,100000", help="Tamaños de galería separados por comas")
+    parser.add_argument("--modo", default=reconocimiento.DETECCION_ESCALADA,
+                        choices=[reconocimiento.DETECCION_COMPLETA, reconocimiento.DETECCION_ESCALADA])
+    parser.add_argument("--escala", type=float, default=0.5, help="Factor de reducción en modo escalado")
+    parser.add_argument("--upsample", type=int, default=1, help="Veces que HOG amplía la imagen")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Pasadas sobre todos los fotogramas")
+    parser.add_argument("--indice", type=int, metavar="NPROBE", help="Medir también el índice IVF con este nprobe")
+    parser.add_argument("--salida", default="bench_reconocimiento.json", help="Archivo JSON de resultados")
+    parser.add_argument("--comparar", help="Informe JSON anterior con el que comparar")
+    args = parser.parse_args()
+
+    fotogramas = cargar_fotogramas(args.fotogramas, (640, 480))
+    if not fotogramas:
+        sys.exit(f"No hay imágenes en {args.fotogramas}")
+    tamanos = [int(t) for t in args.tamanos.split(",")]
+    escala = args.escala if args.modo == reconocimiento.DETECCION_ESCALADA else 1.0
+    reconocimiento.modelos()  # La carga de los modelos no cuenta en la primera medida
+
+    resultados = medir(fotogramas, tamanos, escala, args.upsample, args.repeticiones, args.indice)
+    informe = {
+        "commit": commit_actual(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "parametros": {
+            "fotogramas": len(fotogramas), "modo": args.modo, "escala": escala,
+            "upsample": args.upsample, "repeticiones": args.repeticiones, "nprobe": args.indice,
+        },
+        "rss_maximo_mb": rss_maximo_mb(),
+        **resultados,
+    }
+
+    with open(args.salida, "w") as archivo:
+        json.dump(informe, archivo, indent=2, ensure_ascii=False)
+    print(json.dumps(informe, indent=2, ensure_ascii=False))
+
+    if args.comparar:
+        with open(args.comparar) as archivo:
+            comparar(informe, json.load(archivo))
@@ -0,0 +1,101 @@
+# Script para ejecutar caja.py con hardware simulado y medir su comportamiento
+# fuera de la Raspberry Pi: CPU consumida por hilo y latencia desde cada
+# evento de entrada hasta la reacción del actuador.
+#
+# Uso: python desarrollo/perfilar_simulacion.py desarrollo/cronograma_ejemplo.json \
+#          --fuente carpeta_imagenes --factor 5 --duracion 35
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+# Forzar el hardware simulado antes de importar caja.py
+os.environ["HARDWARE"] = "simulado"
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+TICKS = os.sysconf("SC_CLK_TCK")
+
+
+def cpu_por_hilo():
+    """
+    Devuelve {nombre del hilo: segundos de CPU} leyendo /proc/self/task.
+    """
+    nombres = {hilo.native_id: hilo.name for hilo in threading.enumerate()}
+    consumo = {}
+    for tid in os.listdir("/proc/self/task"):
+        try:
+            with open(f"/proc/self/task/{tid}/stat") as archivo:
+                campos = archivo.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue  # El hilo terminó mientras se leía
+        segundos = (int(campos[11]) + int(campos[12])) / TICKS  # utime + stime
+        nombre = nombres.get(int(tid), f"nativo-{tid}")
+        consumo[nombre] = consumo.get(nombre, 0.0) + segundos
+    return consumo
+
+
+def latencias(registro, entrada, valor_entrada, salida, valor_salida):
+    """
+    Para cada cambio de la entrada al valor indicado, tiempo hasta el siguiente
+    cambio de la salida al valor indicado.
+    """
+    resultado = []
+    for i, (instante, tipo, pin, valor) in enumerate(registro):
+        if tipo != "entrada" or pin != entrada or valor != valor_entrada:
+            continue
+        for instante_salida, tipo_salida, pin_salida, valor_salida_reg in registro[i + 1:]:
+            if tipo_salida == "salida" and pin_salida == salida and valor_salida_reg == valor_salida:
+                resultado.append(instante_salida - instante)
+                break
+    return resultado
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perfilado de caja.py con hardware simulado")
+    parser.add_argument("cronograma", help="JSON con los cambios de las entradas")
+    parser.add_argument("--fuente", help="Carpeta de imágenes o vídeo para la cámara simulada")
+    parser.add_argument("--factor", type=float, default=1.0, help="Velocidad del reloj virtual")
+    parser.add_argument("--duracion", type=float, default=35.0, help="Segundos virtuales a simular")
+    parser.add_argument("--salida", help="Archivo JSON donde guardar el informe")
+    args = parser.parse_args()
+
+    os.environ["FACTOR_RELOJ"] = str(args.factor)
+    if args.fuente:
+        os.environ["FUENTE_CAMARA"] = args.fuente
+
+    import caja
+    from simulacion import cargar_cronograma
+
+    pines = {"presencia": caja.SENSOR_PRESENCIA, "boton": caja.BUTTON_PIN, "puerta": caja.SENSOR_MAGNETICO}
+    cronograma = cargar_cronograma(args.cronograma, pines)
+
+    inicio_cpu = cpu_por_hilo()
+    inicio = time.monotonic()
+    pool = caja.arrancar(cronograma)
+    caja.reloj.sleep(args.duracion)
+    duracion_real = time.monotonic() - inicio
+    fin_cpu = cpu_por_hilo()
+    caja.detener(pool)
+
+    registro = list(caja.GPIO.registro)
+    informe = {
+        "duracion_real": duracion_real,
+        "factor_reloj": args.factor,
+        # CPU en segundos reales por hilo y porcentaje de un núcleo
+        "cpu_por_hilo": {
+            nombre: {"segundos": segundos - inicio_cpu.get(nombre, 0.0),
+                     "porcentaje": 100 * (segundos - inicio_cpu.get(nombre, 0.0)) / duracion_real}
+            for nombre, segundos in sorted(fin_cpu.items())
+        },
+        # Latencias en segundos virtuales
+        "boton_a_servo": latencias(registro, caja.BUTTON_PIN, 0, caja.SERVO_PIN, ("duty", 12)),
+        "boton_a_buzzer": latencias(registro, caja.BUTTON_PIN, 0, caja.BUZZER_PIN, ("duty", 50)),
+        "puerta_a_bloqueo": latencias(registro, caja.SENSOR_MAGNETICO, 0, caja.SERVO_PIN, ("duty", 7)),
+    }
+
+    print(json.dumps(informe, indent=2, ensure_ascii=False))
+    if args.salida:
+        with open(args.salida, "w") as archivo:
+            json.dump(informe, archivo, indent=2, ensure_ascii=False)
@@ -1,11 +1,16 @@
 from picamera2 import Picamera2
 import face_recognition
 import sqlite3
-import numpy as np
 import cv2
 import requests
 from time import sleep
 import libcamera
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import basedatos  # noqa: E402
+import instantanea  # noqa: E402
 
 # Configuracion global
 BOT_TOKEN = "XXX"
@@ -44,14 +49,19 @@ def send_telegram_photo(frame, caption):
 
 # --- BASE DE DATOS ---
 def load_users_from_database():
+    # Si web.py ha publicado una instantánea al día con la base de datos, se usa sin decodificar nada
     users = []
     try:
-        with sqlite3.connect("users.db") as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT name, encoding FROM users")
-            rows = cursor.fetchall()
-            users = [(row[0], np.frombuffer(row[1], dtype=np.float64)) for row in rows]
-    except sqlite3.Error as e:
+        conn = basedatos.conectar()
+        vigente = instantanea.cargar_vigente(conn)
+        if vigente is not None:
+            _, _, _, nombres, matriz, _ = vigente
+            return list(zip(nombres, matriz))
+        # Una entrada por muestra; el lector entiende el esquema antiguo y el actual
+        version = basedatos.version_esquema(conn)
+        rows = basedatos.leer_codificaciones(conn, version)
+        users = [(row[1], row[2]) for row in rows]
+    except (sqlite3.Error, OSError, ValueError) as e:
         print(f"Error en la base de datos: {e}")
     return users
 
@@ -0,0 +1,84 @@
+import queue  # Colas seguras entre hilos
+import threading  # Manejo de hilos para tareas concurrentes
+from reloj import RelojReal
+
+
+class MotorEventos(threading.Thread):
+    """
+    Subsistema de eventos GPIO basado en detección de flancos.
+    RPi.GPIO llama a _al_flanco desde su propio hilo; aquí solo se encola el
+    evento (los rebotes ya los filtra su bouncetime). Un único hilo despachador llama después a
+    los manejadores, así que un manejador lento nunca bloquea la detección.
+    El último nivel estable de cada pin se guarda en caché para leerlo sin tocar el GPIO.
+    """
+
+    def __init__(self, gpio, resincronizar=5.0, reloj=None):
+        super().__init__(daemon=True, name="eventos")
+        self.gpio = gpio
+        self.reloj = reloj or RelojReal()
+        self.resincronizar = resincronizar  # Segundos entre relecturas por si se pierde un flanco
+        self._cola = queue.Queue()
+        self._manejadores = {}  # pin -> lista de funciones manejador(nivel, instante)
+        self._niveles = {}  # pin -> último nivel estable
+        self._antirrebote = {}  # pin -> bouncetime en segundos
+        self._lock = threading.Lock()
+
+    def registrar(self, pin, manejador=None, antirrebote_ms=200):
+        """
+        Activa la detección de flancos en el pin y añade un manejador opcional.
+        El antirrebote se aplica en un único sitio: el bouncetime de RPi.GPIO.
+        """
+        if pin not in self._manejadores:
+            self._manejadores[pin] = []
+            self._niveles[pin] = self.gpio.input(pin)
+            self._antirrebote[pin] = antirrebote_ms / 1000.0
+            self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self._al_flanco, bouncetime=antirrebote_ms)
+        if manejador is not None:
+            self._manejadores[pin].append(manejador)
+
+    def nivel(self, pin):
+        """
+        Devuelve el último nivel estable del pin sin leer el GPIO.
+        """
+        return self._niveles[pin]
+
+    def _al_flanco(self, pin):
+        """
+        Flanco notificado por RPi.GPIO: se entrega siempre, aunque el nivel leído
+        coincida con el guardado. Si una pulsación dura menos que el bouncetime,
+        RPi.GPIO descarta el flanco de soltar, así que el pin se vuelve a leer
+        cuando termina la ventana para corregir el nivel guardado.
+        """
+        nivel = self.gpio.input(pin)
+        with self._lock:
+            self._niveles[pin] = nivel
+        self._cola.put((pin, nivel, self.reloj.time()))
+        temporizador = threading.Timer(self.reloj.a_real(self._antirrebote[pin] + 0.01), self._comprobar, args=(pin,))
+        temporizador.daemon = True
+        temporizador.start()
+
+    def _comprobar(self, pin):
+        """
+        Relee el pin y encola un evento solo si su nivel ha cambiado (flanco perdido).
+        """
+        nivel = self.gpio.input(pin)
+        with self._lock:
+            if nivel == self._niveles.get(pin):
+                return
+            self._niveles[pin] = nivel
+        self._cola.put((pin, nivel, self.reloj.time()))
+
+    def run(self):
+        while True:
+            try:
+                pin, nivel, instante = self._cola.get(timeout=self.reloj.a_real(self.resincronizar))
+            except queue.Empty:
+                # Sin eventos durante un rato: releer los pines por si se perdió algún flanco
+                for pin in list(self._manejadores):
+                    self._comprobar(pin)
+                continue
+            for manejador in self._manejadores.get(pin, []):
+                try:
+                    manejador(nivel, instante)
+                except Exception as e:
+                    print(f"Error en el manejador {manejador.__name__} del pin {pin}: {e}")
@@ -0,0 +1,191 @@
+import threading  # Manejo de hilos para tareas concurrentes
+import numpy as np  # Operaciones con arreglos y cálculos matemáticos
+from indice import IndiceIVF  # Índice aproximado para galerías grandes
+
+DIMENSION = 128  # Tamaño de las codificaciones faciales de face_recognition
+TIPO = np.float32  # Precisión de la matriz: sobra para distancias de ~0.6 y ocupa la mitad que float64
+
+
+def _distancias(face_encodings, matriz, normas):
+    """
+    Distancias euclídeas entre las caras (filas) y la matriz de la galería.
+    """
+    # Las consultas se pasan al tipo de la matriz para que el producto no la convierta entera
+    consultas = np.asarray(face_encodings, dtype=matriz.dtype).reshape(-1, DIMENSION)
+    # |q - g|^2 = |q|^2 - 2 q·g + |g|^2
+    cuadrados = np.einsum("ij,ij->i", consultas, consultas)[:, None] - 2.0 * (consultas @ matriz.T) + normas[None, :]
+    np.maximum(cuadrados, 0.0, out=cuadrados)
+    return np.sqrt(cuadrados, out=cuadrados)
+
+
+class Galeria:
+    """
+    Galería de usuarios registrados para el reconocimiento facial.
+    Guarda todas las codificaciones en una única matriz contigua de NumPy,
+    que solo se reconstruye cuando cambia el conjunto de usuarios.
+    Cada fila se identifica por una clave (el rowid de la base de datos).
+
+    Con `indice_desde` la galería mantiene además un IndiceIVF en cuanto tiene
+    al menos esas filas, y la búsqueda deja de ser un recorrido lineal. Por
+    debajo del umbral, o si el índice no da candidatas, se busca de forma exacta.
+    """
+
+    def __init__(self, tolerancia=0.6, indice_desde=None, nprobe=8):
+        self.tolerancia = tolerancia
+        self.indice_desde = indice_desde  # Tamaño mínimo para usar el índice (None: nunca)
+        self.nprobe = nprobe
+        self._lock = threading.Lock()  # Serializa a los hilos que modifican la galería
+        # El estado se sustituye de una sola vez para que los hilos lectores
+        # nunca vean una matriz (o un índice) a medio construir.
+        self._estado = ([], [], np.empty((0, DIMENSION), dtype=TIPO), np.empty(0, dtype=TIPO), None)
+
+    def __len__(self):
+        return len(self._estado[0])
+
+    def claves(self):
+        """
+        Devuelve un diccionario {clave: nombre} con las filas actuales.
+        """
+        claves, nombres = self._estado[:2]
+        return dict(zip(claves, nombres))
+
+    def _publicar(self, claves, nombres, matriz, indice=None, normas=None):
+        """
+        Publica el nuevo estado. `indice` es el índice anterior ya actualizado
+        con los cambios; se reconstruye si no lo hay o si ha quedado desfasado.
+        """
+        if normas is None:
+            normas = np.einsum("ij,ij->i", matriz, matriz)
+        if self.indice_desde is None or len(matriz) < self.indice_desde:
+            indice = None
+        elif indice is None or indice.desactualizado(len(matriz)):
+            indice = IndiceIVF.construir(matriz, self.nprobe)
+        self._estado = (claves, nombres, matriz, normas, indice)
+
+    def reemplazar(self, filas):
+        """
+        Sustituye toda la galería por las filas (clave, nombre, codificación).
+        """
+        with self._lock:
+            matriz = np.empty((len(filas), DIMENSION), dtype=TIPO)
+            for i, fila in enumerate(filas):
+                matriz[i] = fila[2]
+            self._publicar([f[0] for f in filas], [f[1] for f in filas], matriz)
+
+    def reemplazar_matriz(self, claves, nombres, matriz, normas=None):
+        """
+        Sustituye toda la galería por una matriz ya construida, sin copiarla
+        (por ejemplo, una instantánea mapeada en memoria).
+        """
+        with self._lock:
+            self._publicar(list(claves), list(nombres), matriz, normas=normas)
+
+    def agregar(self, filas):
+        """
+        Añade las filas (clave, nombre, codificación) a la galería.
+        """
+        if not filas:
+            return
+        with self._lock:
+            claves, nombres, matriz, _, indice = self._estado
+            nuevas = np.empty((len(filas), DIMENSION), dtype=TIPO)
+            for i, fila in enumerate(filas):
+                nuevas[i] = fila[2]
+            matriz = np.concatenate((matriz, nuevas))
+            if indice is not None:
+                indice = indice.agregado(matriz, np.arange(len(matriz) - len(filas), len(matriz)))
+            self._publicar(
+                claves + [f[0] for f in filas],
+                nombres + [f[1] for f in filas],
+                matriz,
+                indice,
+            )
+
+    def eliminar(self, claves_eliminadas):
+        """
+        Elimina de la galería las filas con las claves indicadas.
+        """
+        claves_eliminadas = set(claves_eliminadas)
+        if not claves_eliminadas:
+            return
+        with self._lock:
+            claves, nombres, matriz, _, indice = self._estado
+            conservar = [i for i, clave in enumerate(claves) if clave not in claves_eliminadas]
+            if indice is not None:
+                indice = indice.eliminado([i for i, clave in enumerate(claves) if clave in claves_eliminadas])
+            self._publicar(
+                [claves[i] for i in conservar],
+                [nombres[i] for i in conservar],
+                matriz[conservar],
+                indice,
+            )
+
+    def distancias(self, face_encodings):
+        """
+        Calcula en una sola operación las distancias euclídeas entre todas
+        las caras detectadas y todos los usuarios de la galería.
+        Devuelve una matriz (caras x usuarios).
+        """
+        _, _, matriz, normas, _ = self._estado
+        return _distancias(face_encodings, matriz, normas)
+
+    def buscar(self, face_encodings):
+        """
+        Busca el usuario más cercano para cada cara detectada.
+        Devuelve una lista de tuplas (nombre, distancia); el nombre es None
+        si ningún usuario está dentro de la tolerancia. Con índice, las caras
+        que no encuentran a nadie dentro de la tolerancia en las listas
+        revisadas se buscan en toda la galería antes de rechazarlas: el índice
+        solo acelera los aciertos, nunca produce un rechazo que la búsqueda
+        exacta no daría (a cambio, una cara desconocida recorre la galería entera).
+        """
+        _, nombres, matriz, normas, indice = self._estado
+        if not len(face_encodings):
+            return []
+        if not nombres:
+            return [(None, None) for _ in face_encodings]
+
+        consultas = np.asarray(face_encodings, dtype=TIPO).reshape(-1, DIMENSION)
+        if indice is None:
+            return self._exacto(consultas, nombres, matriz, normas)
+        filas, distancias = indice.buscar(consultas, matriz, normas)
+        resultados = [
+            (nombres[fila], float(distancia)) if fila != -1 and distancia <= self.tolerancia else None
+            for fila, distancia in zip(filas, distancias)
+        ]
+        rechazadas = [i for i, resultado in enumerate(resultados) if resultado is None]
+        if rechazadas:
+            for i, resultado in zip(rechazadas, self._exacto(consultas[rechazadas], nombres, matriz, normas)):
+                resultados[i] = resultado
+        return resultados
+
+    def buscar_exacto(self, face_encodings):
+        """
+        Igual que buscar(), pero recorriendo siempre toda la galería.
+        """
+        _, nombres, matriz, normas, _ = self._estado
+        if not len(face_encodings):
+            return []
+        if not nombres:
+            return [(None, None) for _ in face_encodings]
+        return self._exacto(face_encodings, nombres, matriz, normas)
+
+    def _exacto(self, face_encodings, nombres, matriz, normas):
+        distancias = _distancias(face_encodings, matriz, normas)
+        indices = np.argmin(distancias, axis=1)
+        resultados = []
+        for fila, indice in enumerate(indices):
+            distancia = float(distancias[fila, indice])
+            nombre = nombres[indice] if distancia <= self.tolerancia else None
+            resultados.append((nombre, distancia))
+        return resultados
+
+    def mejor_coincidencia(self, face_encodings):
+        """
+        Devuelve la mejor coincidencia (nombre, distancia) entre todas las
+        caras detectadas, o (None, None) si no hay ninguna dentro de la tolerancia.
+        """
+        conocidos = [r for r in self.buscar(face_encodings) if r[0] is not None]
+        if not conocidos:
+            return None, None
+        return min(conocidos, key=lambda r: r[1])
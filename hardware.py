@@ -0,0 +1,35 @@
+import os
+from dotenv import load_dotenv  # Librería para cargar variables de entorno desde un archivo .env
+from reloj import RelojReal, RelojVirtual
+
+# Capa de hardware intercambiable: la Raspberry Pi real o una simulación.
+#   HARDWARE=pi        RPi.GPIO y Picamera2 (por defecto)
+#   HARDWARE=simulado  GPIO y cámara simulados, con reloj virtual
+# En modo simulado:
+#   FACTOR_RELOJ       cuántas veces más rápido que el real avanza el reloj
+#   FUENTE_CAMARA      carpeta de imágenes o vídeo que reproduce la cámara
+#   CRONOGRAMA_GPIO    JSON con los cambios de botón, PIR y puerta a reproducir
+load_dotenv()
+HARDWARE = os.getenv("HARDWARE", "pi")
+SIMULADO = HARDWARE == "simulado"
+
+if SIMULADO:
+    from simulacion import GPIOSimulado, CamaraSimulada
+
+    reloj = RelojVirtual(float(os.getenv("FACTOR_RELOJ", "1")))
+    GPIO = GPIOSimulado(reloj)
+else:
+    import RPi.GPIO as GPIO  # Control de los pines GPIO de la Raspberry Pi
+
+    reloj = RelojReal()
+
+
+def crear_camara():
+    """
+    Crea la cámara del backend elegido. Picamera2 solo se importa en la Raspberry Pi.
+    """
+    if SIMULADO:
+        return CamaraSimulada(os.getenv("FUENTE_CAMARA"), reloj)
+    from picamera2 import Picamera2  # Control de la cámara Raspberry Pi
+
+    return Picamera2()
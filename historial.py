@@ -0,0 +1,120 @@
+import os
+import queue  # Colas seguras entre hilos
+import sqlite3  # Conexión con la base de datos SQLite
+import threading  # Manejo de hilos para tareas concurrentes
+import time  # Plazos de los lotes y de la limpieza
+import basedatos  # Conexiones WAL reutilizadas por hilo
+from reloj import RelojReal
+
+# El historial va en su propia base de datos: así sus escrituras no cambian el
+# PRAGMA data_version de users.db ni provocan recargas de la galería en caja.py.
+RUTA = os.getenv("EVENTOS_DB", "eventos.db")
+RETENCION_DIAS = int(os.getenv("RETENCION_EVENTOS_DIAS", "90"))  # Antigüedad máxima de los eventos
+LIMPIEZA = 3600  # Segundos entre limpiezas por retención, haya eventos o no
+
+ACCESO = "acceso"  # Usuario reconocido que abre la caja
+INTRUSION = "intrusion"  # Pulsación del botón sin usuario reconocido
+BLOQUEO = "bloqueo"  # Bloqueo automático de la caja
+TIPOS = (ACCESO, INTRUSION, BLOQUEO)
+
+
+def preparar(conn):
+    """
+    Crea la tabla de eventos y sus índices si no existen.
+    """
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS eventos ("
+        "id INTEGER PRIMARY KEY, instante REAL NOT NULL, tipo TEXT NOT NULL, "
+        "usuario TEXT, distancia REAL, captura TEXT)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS eventos_instante ON eventos(instante)")
+    conn.execute("CREATE INDEX IF NOT EXISTS eventos_usuario ON eventos(usuario, instante)")
+    conn.execute("CREATE INDEX IF NOT EXISTS eventos_tipo ON eventos(tipo, instante)")
+    conn.commit()
+
+
+def consultar(conn, tipo=None, usuario=None, desde=None, hasta=None, antes_de=None, limite=50):
+    """
+    Página de eventos del más reciente al más antiguo, con filtros opcionales de
+    tipo, usuario e intervalo [desde, hasta). `antes_de` es el (instante, id) del
+    último evento de la página anterior (paginación por clave).
+    Devuelve las filas (id, instante, tipo, usuario, distancia, captura).
+    """
+    condiciones, parametros = [], []
+    for condicion, valor in (("tipo = ?", tipo), ("usuario = ?", usuario), ("instante >= ?", desde), ("instante < ?", hasta)):
+        if valor is not None:
+            condiciones.append(condicion)
+            parametros.append(valor)
+    if antes_de is not None:
+        condiciones.append("(instante, id) < (?, ?)")
+        parametros += list(antes_de)
+    donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    return conn.execute(
+        f"SELECT id, instante, tipo, usuario, distancia, captura FROM eventos {donde} "
+        "ORDER BY instante DESC, id DESC LIMIT ?",
+        parametros + [limite],
+    ).fetchall()
+
+
+class RegistroEventos(threading.Thread):
+    """
+    Historial de eventos de acceso de solo inserción. registrar() solo encola,
+    así que nunca añade latencia a quien lo llama (el manejador del botón);
+    un hilo escribe los eventos por lotes, en una transacción cada
+    `intervalo` segundos como mucho, y cada LIMPIEZA segundos borra los que
+    superan la retención, también si no llega ningún evento. Si la cola se
+    llena, los eventos nuevos se descartan y se cuentan.
+    """
+
+    def __init__(self, ruta=RUTA, capacidad=1000, lote=100, intervalo=0.5, retencion_dias=RETENCION_DIAS, reloj=None):
+        super().__init__(daemon=True, name="historial")
+        self.ruta = ruta
+        self.lote = lote
+        self.intervalo = intervalo
+        self.retencion = retencion_dias * 86400
+        self.reloj = reloj or RelojReal()
+        self.descartados = 0
+        self._cola = queue.Queue(maxsize=capacidad)
+
+    def registrar(self, tipo, usuario=None, distancia=None, captura=None, instante=None):
+        """
+        Encola un evento. `captura` es la referencia de la foto asociada, si la hay.
+        """
+        evento = (instante if instante is not None else self.reloj.time(), tipo, usuario, distancia, captura)
+        try:
+            self._cola.put_nowait(evento)
+        except queue.Full:
+            self.descartados += 1
+
+    def run(self):
+        conn = basedatos.conectar(self.ruta)
+        preparar(conn)
+        limpieza = None  # Última limpieza por retención (monotónico)
+        while True:
+            try:
+                # Espera al primer evento sin consumir CPU, pero no más allá de la próxima limpieza (la primera, al arrancar)
+                espera = 0 if limpieza is None else max(limpieza + LIMPIEZA - time.monotonic(), 0)
+                eventos = [self._cola.get(timeout=espera)]
+            except queue.Empty:
+                eventos = []
+            limite = time.monotonic() + self.intervalo
+            while eventos and len(eventos) < self.lote:
+                try:
+                    eventos.append(self._cola.get(timeout=max(limite - time.monotonic(), 0)))
+                except queue.Empty:
+                    break
+            try:
+                if eventos:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO eventos (instante, tipo, usuario, distancia, captura) VALUES (?, ?, ?, ?, ?)",
+                            eventos,
+                        )
+                if limpieza is None or time.monotonic() - limpieza >= LIMPIEZA:
+                    limpieza = time.monotonic()
+                    with conn:
+                        borrados = conn.execute("DELETE FROM eventos WHERE instante < ?", (self.reloj.time() - self.retencion,)).rowcount
+                    if borrados:
+                        print(f"Historial: {borrados} eventos antiguos eliminados.")
+            except sqlite3.Error as e:
+                print(f"Error al guardar {len(eventos)} eventos en el historial: {e}")
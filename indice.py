@@ -0,0 +1,107 @@
+import numpy as np  # Operaciones con arreglos y cálculos matemáticos
+
+
+def _distancias_cuadradas(consultas, matriz, normas):
+    """
+    Distancias euclídeas al cuadrado entre filas de `consultas` y de `matriz`.
+    """
+    cuadrados = np.einsum("ij,ij->i", consultas, consultas)[:, None] - 2.0 * (consultas @ matriz.T) + normas[None, :]
+    return np.maximum(cuadrados, 0.0, out=cuadrados)
+
+
+class IndiceIVF:
+    """
+    Índice aproximado de vecino más cercano para galerías grandes (IVF).
+    Agrupa las codificaciones con k-means en `num_listas` listas invertidas y,
+    para cada consulta, solo compara con las filas de las `nprobe` listas cuyos
+    centroides están más cerca, en lugar de recorrer toda la galería.
+    Es inmutable: añadir o eliminar filas devuelve un índice nuevo, así la galería
+    puede publicarlo junto a su matriz de una sola vez.
+    """
+
+    def __init__(self, centroides, listas, tamano_construccion, nprobe):
+        self.centroides = centroides
+        self.normas_centroides = np.einsum("ij,ij->i", centroides, centroides)
+        self.listas = listas  # Índices de fila de la galería en cada lista
+        self.tamano_construccion = tamano_construccion
+        self.nprobe = nprobe
+
+    @classmethod
+    def construir(cls, matriz, nprobe=8, iteraciones=10, muestra=20000, semilla=0):
+        """
+        Entrena los centroides con k-means sobre una muestra de la galería
+        (unas sqrt(n) listas) y reparte todas las filas entre ellos.
+        """
+        rng = np.random.default_rng(semilla)
+        n = len(matriz)
+        num_listas = max(int(np.sqrt(n)), 1)
+        entrenamiento = matriz[rng.choice(n, size=min(muestra, n), replace=False)]
+        centroides = entrenamiento[rng.choice(len(entrenamiento), size=num_listas, replace=False)].copy()
+        for _ in range(iteraciones):
+            asignacion = np.argmin(
+                _distancias_cuadradas(entrenamiento, centroides, np.einsum("ij,ij->i", centroides, centroides)), axis=1
+            )
+            sumas = np.zeros_like(centroides)
+            np.add.at(sumas, asignacion, entrenamiento)
+            cuentas = np.bincount(asignacion, minlength=num_listas)
+            con_filas = cuentas > 0
+            centroides[con_filas] = sumas[con_filas] / cuentas[con_filas, None]
+        indice = cls(centroides, [np.empty(0, dtype=np.int64)] * num_listas, n, nprobe)
+        return indice.agregado(matriz, np.arange(n))
+
+    def _lista_de(self, filas):
+        return np.argmin(_distancias_cuadradas(filas, self.centroides, self.normas_centroides), axis=1)
+
+    def agregado(self, matriz, indices_nuevos):
+        """
+        Devuelve un índice con las filas `indices_nuevos` de la matriz asignadas a su lista.
+        """
+        indices_nuevos = np.asarray(indices_nuevos, dtype=np.int64)
+        listas = list(self.listas)
+        if len(indices_nuevos):
+            asignacion = self._lista_de(matriz[indices_nuevos])
+            orden = np.argsort(asignacion, kind="stable")
+            grupos, inicios = np.unique(asignacion[orden], return_index=True)
+            for grupo, trozo in zip(grupos, np.split(indices_nuevos[orden], inicios[1:])):
+                listas[grupo] = np.concatenate((listas[grupo], trozo))
+        return IndiceIVF(self.centroides, listas, self.tamano_construccion, self.nprobe)
+
+    def eliminado(self, indices_eliminados):
+        """
+        Devuelve un índice sin las filas eliminadas y con el resto renumerado
+        igual que la galería compacta su matriz.
+        """
+        eliminados = np.sort(np.asarray(indices_eliminados, dtype=np.int64))
+        listas = []
+        for lista in self.listas:
+            lista = lista[~np.isin(lista, eliminados)]
+            listas.append(lista - np.searchsorted(eliminados, lista))
+        return IndiceIVF(self.centroides, listas, self.tamano_construccion, self.nprobe)
+
+    def desactualizado(self, tamano):
+        """
+        Indica si la galería ha cambiado tanto desde la construcción que conviene reentrenar.
+        """
+        return tamano > 2 * self.tamano_construccion or tamano < self.tamano_construccion // 2
+
+    def buscar(self, consultas, matriz, normas):
+        """
+        Devuelve, para cada consulta, (fila más cercana, distancia) entre las
+        filas de sus `nprobe` listas más cercanas. La fila es -1 si no hay candidatas.
+        """
+        nprobe = min(self.nprobe, len(self.listas))
+        cercanas = np.argpartition(
+            _distancias_cuadradas(consultas, self.centroides, self.normas_centroides), nprobe - 1, axis=1
+        )[:, :nprobe]
+        filas, distancias = [], []
+        for consulta, listas in zip(consultas, cercanas):
+            candidatas = np.concatenate([self.listas[i] for i in listas])
+            if not len(candidatas):
+                filas.append(-1)
+                distancias.append(np.inf)
+                continue
+            cuadrados = _distancias_cuadradas(consulta[None, :], matriz[candidatas], normas[candidatas])[0]
+            mejor = int(np.argmin(cuadrados))
+            filas.append(int(candidatas[mejor]))
+            distancias.append(float(np.sqrt(cuadrados[mejor])))
+        return filas, distancias
@@ -0,0 +1,112 @@
+import fcntl  # Bloqueo entre procesos que publican a la vez
+import json  # Índice de claves y nombres de cada versión
+import os
+import numpy as np  # Operaciones con arreglos y cálculos matemáticos
+import basedatos  # Esquema de users.db y lectura de las codificaciones
+from galeria import DIMENSION, TIPO
+
+DIRECTORIO = os.getenv("INSTANTANEA_GALERIA", "galeria")  # Carpeta de las instantáneas
+CONSERVAR = 3  # Versiones antiguas que se mantienen para los lectores que aún las usan
+
+
+def _ruta(directorio, version, sufijo):
+    return os.path.join(directorio, f"v{version:08d}{sufijo}")
+
+
+def _escribir_atomico(ruta, escribir):
+    """
+    Escribe en un temporal y lo renombra, para que nadie vea el archivo a medias.
+    """
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "wb") as archivo:
+        escribir(archivo)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, ruta)
+
+
+def version_actual(directorio=DIRECTORIO):
+    """
+    Devuelve la versión publicada más reciente, o None si no hay ninguna.
+    """
+    try:
+        with open(os.path.join(directorio, "ACTUAL")) as archivo:
+            return int(archivo.read())
+    except (OSError, ValueError):
+        return None
+
+
+def publicar(conn, directorio=DIRECTORIO):
+    """
+    Publica una instantánea inmutable de la galería a partir de la base de datos:
+    la matriz de codificaciones y sus normas en .npy contiguos, y las claves y
+    nombres en JSON junto con la generación de la base de datos que refleja. El archivo ACTUAL apunta a la versión nueva y se sustituye
+    en último lugar, así que los lectores pasan de una versión completa a otra.
+    Devuelve el número de versión publicado.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    with open(os.path.join(directorio, ".bloqueo"), "w") as bloqueo:
+        fcntl.flock(bloqueo, fcntl.LOCK_EX)  # Dos publicaciones simultáneas no comparten número
+        esquema = basedatos.version_esquema(conn)
+        # Antes de leer: si alguien escribe entre medias, la instantánea parecerá antigua, nunca nueva
+        generacion = basedatos.generacion(conn)
+        filas = basedatos.leer_codificaciones(conn, esquema)
+        matriz = np.empty((len(filas), DIMENSION), dtype=TIPO)
+        for i, fila in enumerate(filas):
+            matriz[i] = fila[2]
+        normas = np.einsum("ij,ij->i", matriz, matriz)
+        indice = {"esquema": esquema, "generacion": generacion, "claves": [f[0] for f in filas], "nombres": [f[1] for f in filas]}
+
+        version = (version_actual(directorio) or 0) + 1
+        _escribir_atomico(_ruta(directorio, version, ".npy"), lambda a: np.save(a, matriz))
+        _escribir_atomico(_ruta(directorio, version, "_normas.npy"), lambda a: np.save(a, normas))
+        _escribir_atomico(_ruta(directorio, version, ".json"), lambda a: a.write(json.dumps(indice).encode()))
+        _escribir_atomico(os.path.join(directorio, "ACTUAL"), lambda a: a.write(str(version).encode()))
+
+        # Los procesos que aún tengan mapeada una versión borrada la siguen leyendo sin problema
+        for antigua in range(version - CONSERVAR, 0, -1):
+            if not os.path.exists(_ruta(directorio, antigua, ".json")):
+                break
+            for sufijo in (".npy", "_normas.npy", ".json"):
+                try:
+                    os.remove(_ruta(directorio, antigua, sufijo))
+                except OSError:
+                    pass
+    return version
+
+
+def cargar(version, directorio=DIRECTORIO):
+    """
+    Abre una versión publicada sin copiarla: devuelve (esquema, generacion, claves,
+    nombres, matriz, normas) con la matriz y las normas mapeadas en memoria de solo
+    lectura. Todos los procesos que cargan la misma versión comparten las páginas.
+    La generación es None en las instantáneas anteriores al esquema 4.
+    """
+    with open(_ruta(directorio, version, ".json")) as archivo:
+        indice = json.load(archivo)
+    matriz = np.load(_ruta(directorio, version, ".npy"), mmap_mode="r")
+    normas = np.load(_ruta(directorio, version, "_normas.npy"), mmap_mode="r")
+    return indice["esquema"], indice.get("generacion"), indice["claves"], indice["nombres"], matriz, normas
+
+
+def al_dia(generacion, conn):
+    """
+    True si una instantánea de esa generación refleja la base de datos actual.
+    Las instantáneas sin generación (anteriores al esquema 4) nunca lo están.
+    """
+    return generacion is not None and generacion == basedatos.generacion(conn)
+
+
+def cargar_vigente(conn, directorio=DIRECTORIO):
+    """
+    Carga la última versión publicada si está al día con la base de datos.
+    Devuelve (version, esquema, claves, nombres, matriz, normas), o None si no
+    hay instantánea o se ha quedado atrás y hay que leer la base de datos.
+    """
+    version = version_actual(directorio)
+    if version is None:
+        return None
+    esquema, generacion, claves, nombres, matriz, normas = cargar(version, directorio)
+    if not al_dia(generacion, conn):
+        return None
+    return version, esquema, claves, nombres, matriz, normas
@@ -0,0 +1,43 @@
+import os
+import tempfile  # Carpeta temporal por defecto para los latidos
+import time  # Antigüedad de los latidos
+
+# Cada proceso supervisado toca su archivo de latido mientras está sano;
+# AccesoSeguro.py lo reinicia si el latido deja de llegar.
+DIRECTORIO = os.getenv("LATIDOS_DIR", os.path.join(tempfile.gettempdir(), "acceso_seguro"))
+
+
+def ruta(nombre, directorio=DIRECTORIO):
+    return os.path.join(directorio, f"{nombre}.latido")
+
+
+def latir(nombre, directorio=DIRECTORIO):
+    """
+    Marca que el proceso sigue vivo actualizando la fecha de su archivo.
+    """
+    archivo = ruta(nombre, directorio)
+    try:
+        os.utime(archivo)
+    except FileNotFoundError:
+        os.makedirs(directorio, exist_ok=True)
+        open(archivo, "a").close()
+
+
+def edad(nombre, directorio=DIRECTORIO):
+    """
+    Segundos desde el último latido, o None si el proceso nunca ha latido.
+    """
+    try:
+        return time.time() - os.path.getmtime(ruta(nombre, directorio))
+    except OSError:
+        return None
+
+
+def olvidar(nombre, directorio=DIRECTORIO):
+    """
+    Borra el latido anterior para que un proceso recién arrancado no parezca sano.
+    """
+    try:
+        os.remove(ruta(nombre, directorio))
+    except FileNotFoundError:
+        pass
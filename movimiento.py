@@ -0,0 +1,102 @@
+import cv2  # Reducción, escala de grises y diferencia de fotogramas
+from reloj import RelojReal
+
+AUSENTE = ""  # Estado de los resultados sin ninguna cara a la vista
+
+
+class CompuertaMovimiento:
+    """
+    Decide qué fotogramas merecen un reconocimiento completo y cada cuánto.
+
+    Cada fotograma se reduce a `ancho` píxeles en escala de grises y se compara
+    con el último procesado: si menos de `fraccion` de los píxeles cambian más
+    de `umbral` niveles, la escena es la misma y el fotograma se omite. Aun así
+    se procesa uno cada `refresco` segundos para no quedarse con un resultado viejo.
+
+    El intervalo entre reconocimientos se adapta: `rapido` durante los primeros
+    `rafaga` segundos tras el flanco del PIR, `lento` cuando la misma persona
+    lleva `estables` resultados identificada o no hay ninguna cara, y `normal`
+    en el resto de casos. contar_caras() devuelve las caras a la vista cuando
+    la etapa no las indica en resultado().
+    """
+
+    def __init__(self, ancho=80, umbral=12, fraccion=0.005, refresco=2.0,
+                 rapido=0.05, normal=0.1, lento=0.5, rafaga=2.0, estables=3,
+                 contar_caras=None, reloj=None):
+        self.ancho = ancho
+        self.umbral = umbral
+        self.fraccion = fraccion
+        self.refresco = refresco
+        self.rapido = rapido
+        self.normal = normal
+        self.lento = lento
+        self.rafaga = rafaga
+        self.estables = estables
+        self.contar_caras = contar_caras
+        self.reloj = reloj or RelojReal()
+        self.procesados = 0  # Totales desde el arranque
+        self.omitidos = 0
+        self.inicio_presencia()
+
+    def inicio_presencia(self):
+        """
+        Flanco del PIR: olvida la escena anterior y empieza la ráfaga.
+        """
+        self._referencia = None
+        self._procesado = None  # Instante (monotónico) del último fotograma procesado
+        self._inicio = self.reloj.monotonic()
+        self._ultimo_estado = None
+        self._repeticiones = 0
+
+    def _reducir(self, frame):
+        alto, ancho = frame.shape[:2]
+        pequeno = cv2.resize(frame, (self.ancho, max(alto * self.ancho // ancho, 1)), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(pequeno, cv2.COLOR_BGR2GRAY) if pequeno.ndim == 3 else pequeno
+
+    def debe_procesar(self, fotograma):
+        """
+        Devuelve True si el fotograma debe reconocerse y False si se omite.
+        """
+        ahora = self.reloj.monotonic()
+        gris = self._reducir(fotograma.frame)
+        procesar = (
+            self._referencia is None
+            or ahora - self._procesado >= self.refresco
+            or cv2.countNonZero(cv2.threshold(cv2.absdiff(gris, self._referencia), self.umbral, 255, cv2.THRESH_BINARY)[1])
+            >= self.fraccion * gris.size
+        )
+        if procesar:
+            self._referencia = gris
+            self._procesado = ahora
+            self.procesados += 1
+        else:
+            self.omitidos += 1
+        return procesar
+
+    def resultado(self, nombre, caras=None):
+        """
+        Anota el resultado de un reconocimiento para adaptar el intervalo.
+        """
+        if caras is None and self.contar_caras is not None:
+            caras = self.contar_caras()
+        if nombre is not None:
+            estado = nombre
+        elif caras == 0:
+            estado = AUSENTE
+        else:
+            estado = None  # Cara sin identificar (o sin contar): nunca se considera estable
+        if estado is not None and estado == self._ultimo_estado:
+            self._repeticiones += 1
+        else:
+            self._repeticiones = 1
+        self._ultimo_estado = estado
+
+    def intervalo(self):
+        """
+        Segundos mínimos hasta el siguiente reconocimiento.
+        """
+        if self.reloj.monotonic() - self._inicio < self.rafaga:
+            return self.rapido
+        if self._ultimo_estado is not None and self._repeticiones >= self.estables:
+            return self.lento
+        return self.normal
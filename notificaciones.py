@@ -0,0 +1,114 @@
+import queue  # Colas seguras entre hilos
+import threading  # Manejo de hilos para tareas concurrentes
+import time  # Manejo de tiempos y pausas
+import cv2  # Procesamiento de imágenes y captura de video
+import requests  # Envío de solicitudes HTTP, usado para la API de Telegram
+
+
+class Notificacion:
+    """
+    Envío pendiente a Telegram. `repeticiones` cuenta los avisos iguales que
+    se han agrupado en este mientras esperaba en la cola.
+    """
+
+    def __init__(self, metodo, texto, frame=None, clave=None):
+        self.metodo = metodo  # "sendMessage" o "sendPhoto"
+        self.texto = texto
+        self.frame = frame
+        self.clave = clave
+        self.repeticiones = 1
+
+
+class Notificador(threading.Thread):
+    """
+    Cola de notificaciones salientes a Telegram vaciada por un hilo en segundo plano.
+    Reutiliza una única requests.Session con keep-alive, aplica timeouts y
+    reintentos acotados con espera exponencial, y agrupa los avisos repetidos
+    con la misma clave que aún no se han enviado. Encolar nunca bloquea:
+    si la cola está llena, el aviso se descarta.
+    """
+
+    def __init__(self, bot_token, chat_id, capacidad=50, timeout=(3.05, 10), reintentos=3, espera=1.0):
+        super().__init__(daemon=True, name="notificador")
+        self.bot_token = bot_token
+        self.chat_id = chat_id
+        self.timeout = timeout  # (conexión, lectura) en segundos
+        self.reintentos = reintentos
+        self.espera = espera  # Espera antes del primer reintento; se duplica en cada uno
+        self.session = requests.Session()
+        self._cola = queue.Queue(maxsize=capacidad)
+        self._pendientes = {}  # clave -> Notificacion aún en la cola
+        self._lock = threading.Lock()
+
+    def mensaje(self, texto, clave=None):
+        """
+        Encola un mensaje de texto.
+        """
+        self._encolar(Notificacion("sendMessage", texto, clave=clave))
+
+    def foto(self, frame, texto, clave=None):
+        """
+        Encola una foto con pie de foto. `frame` puede ser un fotograma, que se
+        codifica en JPG en el hilo del notificador, o los bytes de un JPG ya codificado.
+        """
+        self._encolar(Notificacion("sendPhoto", texto, frame=frame, clave=clave))
+
+    def _encolar(self, notificacion):
+        if not self.bot_token or not self.chat_id:
+            print("Error: BOT_TOKEN o CHAT_ID no configurados.")
+            return
+        with self._lock:
+            pendiente = self._pendientes.get(notificacion.clave)
+            if pendiente is not None:
+                pendiente.repeticiones += 1
+                return
+            try:
+                self._cola.put_nowait(notificacion)
+            except queue.Full:
+                print(f"Cola de notificaciones llena, se descarta: {notificacion.texto}")
+                return
+            if notificacion.clave is not None:
+                self._pendientes[notificacion.clave] = notificacion
+
+    def run(self):
+        while True:
+            notificacion = self._cola.get()
+            with self._lock:
+                if self._pendientes.get(notificacion.clave) is notificacion:
+                    del self._pendientes[notificacion.clave]
+            try:
+                self._enviar(notificacion)
+            except Exception as e:
+                print(f"Error al enviar notificación a Telegram: {e}")
+
+    def _enviar(self, notificacion):
+        texto = notificacion.texto
+        if notificacion.repeticiones > 1:
+            texto = f"{texto} (x{notificacion.repeticiones})"
+        url = f"https://api.telegram.org/bot{self.bot_token}/{notificacion.metodo}"
+        if notificacion.metodo == "sendPhoto":
+            foto = notificacion.frame
+            if not isinstance(foto, bytes):
+                _, buffer = cv2.imencode('.jpg', foto)  # Convertir imagen a formato JPG
+                foto = buffer.tobytes()
+            datos = {"chat_id": self.chat_id, "caption": texto}
+            archivos = {"photo": foto}
+        else:
+            datos = {"chat_id": self.chat_id, "text": texto}
+            archivos = None
+
+        for intento in range(self.reintentos + 1):
+            try:
+                response = self.session.post(url, data=datos, files=archivos, timeout=self.timeout)
+                if response.status_code < 500 and response.status_code != 429:
+                    response.raise_for_status()  # Los errores 4xx no se reintentan
+                    return
+                error = f"HTTP {response.status_code}"
+            except requests.exceptions.HTTPError as e:
+                print(f"Error al enviar notificación a Telegram: {e}")
+                return
+            except requests.exceptions.RequestException as e:
+                error = e
+            if intento < self.reintentos:
+                time.sleep(self.espera * 2 ** intento)
+        print(f"Error al enviar notificación a Telegram tras {self.reintentos + 1} intentos: {error}")
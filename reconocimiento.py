@@ -0,0 +1,101 @@
+import threading  # Precarga de los modelos en segundo plano
+import time  # Duración de la precarga
+import cv2  # Procesamiento de imágenes y captura de video
+
+# Modos de detección de caras
+DETECCION_COMPLETA = "completo"  # HOG sobre el fotograma completo
+DETECCION_ESCALADA = "escalado"  # HOG sobre el fotograma reducido
+DETECCION_LORES = "lores"  # HOG sobre el flujo lores de Picamera2
+CARA_MINIMA_HOG = 80  # Lado aproximado (px) de la cara más pequeña que HOG encuentra sin ampliar la imagen
+
+listo = threading.Event()  # Activo cuando face_recognition y sus modelos ya están cargados
+
+
+def modelos():
+    """
+    Devuelve el módulo face_recognition. Importarlo carga dlib y sus modelos,
+    que tardan varios segundos, así que no se hace al importar este módulo sino
+    la primera vez que se necesita (o antes, con precalentar()).
+    """
+    import face_recognition  # Reconocimiento facial
+
+    listo.set()
+    return face_recognition
+
+
+def precalentar():
+    """
+    Carga los modelos en un hilo para que el primer reconocimiento no espere.
+    No debe llamarse antes de crear procesos con fork.
+    """
+    def cargar():
+        inicio = time.monotonic()
+        modelos()
+        print(f"Modelos de reconocimiento cargados en {(time.monotonic() - inicio) * 1000:.0f} ms.")
+
+    threading.Thread(target=cargar, daemon=True, name="precarga").start()
+
+
+def cara_minima(escala=1.0, upsample=1):
+    """
+    Lado aproximado, en píxeles del fotograma completo, de la cara más pequeña
+    que se detecta. Cada upsample duplica la imagen y reducirla a `escala` la
+    divide: a 0.5 con upsample 1 la cara mínima es el doble que a escala completa
+    con upsample 1, y con upsample 2 vuelve a ser la misma, pero HOG recorre
+    entonces tantos píxeles como en el fotograma completo y no se ahorra nada.
+    """
+    return CARA_MINIMA_HOG / (escala * 2 ** upsample)
+
+
+def luminancia_lores(lores_frame, size):
+    """
+    Extrae el plano Y (escala de grises) de un fotograma lores en YUV420.
+    """
+    ancho, alto = size
+    return lores_frame[:alto, :ancho]
+
+
+def detectar_caras(rgb_frame, escala=1.0, upsample=1, imagen_deteccion=None):
+    """
+    Detecta caras con HOG sobre una versión reducida del fotograma y devuelve
+    las cajas (top, right, bottom, left) en coordenadas del fotograma completo.
+    Si se pasa imagen_deteccion (por ejemplo el flujo lores), se usa esa imagen
+    en lugar de reducir el fotograma.
+    """
+    alto, ancho = rgb_frame.shape[:2]
+    if imagen_deteccion is None:
+        if escala == 1.0:
+            return modelos().face_locations(rgb_frame, upsample)
+        imagen_deteccion = cv2.resize(rgb_frame, (0, 0), fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+
+    factor_y = alto / imagen_deteccion.shape[0]
+    factor_x = ancho / imagen_deteccion.shape[1]
+    cajas = []
+    for top, right, bottom, left in modelos().face_locations(imagen_deteccion, upsample):
+        cajas.append((
+            max(int(top * factor_y), 0),
+            min(int(right * factor_x), ancho),
+            min(int(bottom * factor_y), alto),
+            max(int(left * factor_x), 0),
+        ))
+    return cajas
+
+
+def codificar_caras(rgb_frame, cajas):
+    """
+    Calcula las codificaciones a resolución completa, solo en las cajas indicadas.
+    """
+    if not cajas:
+        return []
+    return modelos().face_encodings(rgb_frame, cajas)
+
+
+def procesar_frame(rgb_frame, galeria, escala=1.0, upsample=1, imagen_deteccion=None):
+    """
+    Detecta, codifica y busca en la galería todas las caras del fotograma.
+    Devuelve una lista de tuplas (caja, nombre, distancia).
+    """
+    cajas = detectar_caras(rgb_frame, escala, upsample, imagen_deteccion)
+    face_encodings = codificar_caras(rgb_frame, cajas)
+    resultados = galeria.buscar(face_encodings)
+    return [(caja, nombre, distancia) for caja, (nombre, distancia) in zip(cajas, resultados)]
@@ -0,0 +1,47 @@
+import time  # Manejo de tiempos y pausas
+
+
+class RelojReal:
+    """
+    Reloj del sistema. Todas las esperas y marcas de tiempo de la caja pasan
+    por un reloj para poder sustituirlo por uno virtual en la simulación.
+    """
+
+    def time(self):
+        return time.time()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, segundos):
+        time.sleep(segundos)
+
+    def a_real(self, segundos):
+        """
+        Convierte una duración del reloj a segundos reales (para timeouts de hilos).
+        """
+        return segundos
+
+
+class RelojVirtual(RelojReal):
+    """
+    Reloj que avanza `factor` veces más rápido que el real. Con factor 10 el
+    bloqueo automático de 5 segundos se dispara a los 0,5 segundos reales.
+    """
+
+    def __init__(self, factor=1.0):
+        self.factor = factor
+        self._inicio_real = time.monotonic()
+        self._inicio_epoch = time.time()
+
+    def time(self):
+        return self._inicio_epoch + self.monotonic()
+
+    def monotonic(self):
+        return (time.monotonic() - self._inicio_real) * self.factor
+
+    def sleep(self, segundos):
+        time.sleep(segundos / self.factor)
+
+    def a_real(self, segundos):
+        return segundos / self.factor
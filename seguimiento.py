@@ -0,0 +1,165 @@
+import cv2  # Procesamiento de imágenes y captura de video
+from reloj import RelojReal
+
+
+def iou(a, b):
+    """
+    Intersección sobre unión de dos cajas (top, right, bottom, left).
+    """
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    interseccion = max(0, bottom - top) * max(0, right - left)
+    if interseccion == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return interseccion / float(area_a + area_b - interseccion)
+
+
+class Pista:
+    """
+    Cara seguida entre fotogramas junto con su identidad conocida.
+    """
+
+    def __init__(self, caja):
+        self.caja = caja
+        self.nombre = None
+        self.distancia = None
+        self.codificada = None  # Momento de la última codificación (None si nunca)
+        self.fallos = 0  # Fotogramas seguidos sin encontrar la cara
+        self.plantilla = None  # Recorte en grises para el seguimiento entre detecciones
+
+
+class Seguidor:
+    """
+    Sigue las caras detectadas entre fotogramas para no recalcular su codificación.
+    Asocia las detecciones con las pistas por IoU y, entre detecciones, mueve
+    cada pista con una búsqueda de plantilla en una ventana alrededor de su caja.
+    Solo se codifica una cara cuando aparece una pista nueva o cuando su identidad
+    tiene más de `refresco` segundos, y también cuando una pista que se había
+    perdido vuelve a asociarse: por IoU puede haber recogido otra cara.
+
+    reiniciar() puede llamarse desde cualquier hilo: solo marca el reinicio, y
+    es el hilo que llama a actualizar() quien vacía las pistas.
+    """
+
+    def __init__(self, intervalo_deteccion=5, refresco=2.0, umbral_iou=0.3, max_fallos=3, umbral_plantilla=0.6, reloj=None):
+        self.reloj = reloj or RelojReal()
+        self.intervalo_deteccion = intervalo_deteccion
+        self.refresco = refresco
+        self.umbral_iou = umbral_iou
+        self.max_fallos = max_fallos
+        self.umbral_plantilla = umbral_plantilla
+        self.pistas = []
+        self.fotogramas = 0
+        self.codificaciones = 0  # Contador de caras codificadas, útil para medir el ahorro
+        self._reinicio = False  # Reinicio pedido desde otro hilo, pendiente de aplicar
+
+    def reiniciar(self):
+        """
+        Olvida todas las pistas (por ejemplo, cuando no hay nadie delante o se
+        revoca un acceso). Se aplica en la siguiente llamada a actualizar().
+        """
+        self._reinicio = True
+
+    def actualizar(self, rgb_frame, detectar, codificar, galeria):
+        """
+        Procesa un fotograma y devuelve las pistas activas.
+        detectar(rgb_frame) devuelve cajas y codificar(rgb_frame, cajas) sus codificaciones.
+        """
+        if self._reinicio:
+            self._reinicio = False
+            self.pistas = []
+            self.fotogramas = 0
+        gris = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        if not self.pistas or self.fotogramas % self.intervalo_deteccion == 0:
+            self._asociar(detectar(rgb_frame))
+        else:
+            for pista in self.pistas:
+                self._seguir(pista, gris)
+        self.fotogramas += 1
+        self.pistas = [p for p in self.pistas if p.fallos <= self.max_fallos]
+
+        ahora = self.reloj.monotonic()
+        pendientes = [
+            p for p in self.pistas
+            if p.fallos == 0 and (p.codificada is None or ahora - p.codificada >= self.refresco)
+        ]
+        if pendientes:
+            face_encodings = codificar(rgb_frame, [p.caja for p in pendientes])
+            for pista, (nombre, distancia) in zip(pendientes, galeria.buscar(face_encodings)):
+                pista.nombre, pista.distancia, pista.codificada = nombre, distancia, ahora
+            self.codificaciones += len(pendientes)
+
+        for pista in self.pistas:
+            if pista.fallos == 0:
+                top, right, bottom, left = pista.caja
+                pista.plantilla = gris[top:bottom, left:right].copy()
+        return self.pistas
+
+    def identificado(self):
+        """
+        Devuelve la pista identificada más cercana como (nombre, distancia), o (None, None).
+        """
+        if self._reinicio:
+            return None, None  # Las identidades pendientes de olvidar ya no valen
+        conocidas = [p for p in self.pistas if p.nombre is not None]
+        if not conocidas:
+            return None, None
+        mejor = min(conocidas, key=lambda p: p.distancia)
+        return mejor.nombre, mejor.distancia
+
+    def _asociar(self, cajas):
+        """
+        Asocia las cajas detectadas a las pistas existentes por IoU (voraz).
+        """
+        pares = sorted(
+            ((iou(pista.caja, caja), i, j) for i, pista in enumerate(self.pistas) for j, caja in enumerate(cajas)),
+            reverse=True,
+        )
+        pistas_usadas, cajas_usadas = set(), set()
+        for valor, i, j in pares:
+            if valor < self.umbral_iou:
+                break
+            if i in pistas_usadas or j in cajas_usadas:
+                continue
+            pista = self.pistas[i]
+            if pista.fallos > 0:
+                # Estaba perdida: la identidad se vuelve a comprobar en vez de heredarse
+                pista.nombre = pista.distancia = pista.codificada = None
+            pista.caja = cajas[j]
+            pista.fallos = 0
+            pistas_usadas.add(i)
+            cajas_usadas.add(j)
+
+        for i, pista in enumerate(self.pistas):
+            if i not in pistas_usadas:
+                pista.fallos += 1
+        for j, caja in enumerate(cajas):
+            if j not in cajas_usadas:
+                self.pistas.append(Pista(caja))
+
+    def _seguir(self, pista, gris):
+        """
+        Mueve la pista buscando su plantilla en una ventana alrededor de la última caja.
+        """
+        if pista.plantilla is None or pista.plantilla.size == 0:
+            pista.fallos += 1
+            return
+        top, right, bottom, left = pista.caja
+        alto, ancho = bottom - top, right - left
+        margen_y, margen_x = alto // 2, ancho // 2
+        y0, x0 = max(top - margen_y, 0), max(left - margen_x, 0)
+        y1, x1 = min(bottom + margen_y, gris.shape[0]), min(right + margen_x, gris.shape[1])
+        ventana = gris[y0:y1, x0:x1]
+        if ventana.shape[0] < pista.plantilla.shape[0] or ventana.shape[1] < pista.plantilla.shape[1]:
+            pista.fallos += 1
+            return
+
+        resultado = cv2.matchTemplate(ventana, pista.plantilla, cv2.TM_CCOEFF_NORMED)
+        _, puntuacion, _, (dx, dy) = cv2.minMaxLoc(resultado)
+        if puntuacion < self.umbral_plantilla:
+            pista.fallos += 1
+            return
+        pista.caja = (y0 + dy, x0 + dx + ancho, y0 + dy + alto, x0 + dx)
+        pista.fallos = 0
@@ -0,0 +1,229 @@
+import glob  # Búsqueda de archivos de imagen
+import json  # Lectura de cronogramas
+import os
+import threading  # Manejo de hilos para tareas concurrentes
+import cv2  # Procesamiento de imágenes y captura de video
+import numpy as np  # Operaciones con arreglos y cálculos matemáticos
+
+
+class PWMSimulado:
+    """
+    PWM simulado: registra los cambios de ciclo de trabajo y frecuencia.
+    """
+
+    def __init__(self, gpio, pin, frecuencia):
+        self.gpio = gpio
+        self.pin = pin
+        self.frecuencia = frecuencia
+        self.duty_cycle = 0
+
+    def start(self, duty_cycle):
+        self.ChangeDutyCycle(duty_cycle)
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.gpio._registrar_salida(self.pin, ("duty", duty_cycle))
+
+    def ChangeFrequency(self, frecuencia):
+        self.frecuencia = frecuencia
+        self.gpio._registrar_salida(self.pin, ("frecuencia", frecuencia))
+
+    def stop(self):
+        self.ChangeDutyCycle(0)
+
+
+class GPIOSimulado:
+    """
+    Sustituto de RPi.GPIO para ejecutar la caja fuera de la Raspberry Pi.
+    Las entradas se cambian con fijar() o reproduciendo un cronograma; los
+    flancos llaman a las funciones de add_event_detect desde otro hilo, igual
+    que RPi.GPIO, respetando el bouncetime en tiempo del reloj.
+    Todas las entradas y salidas quedan en `registro` para medir latencias.
+    """
+
+    BCM = "BCM"
+    BOARD = "BOARD"
+    IN = "IN"
+    OUT = "OUT"
+    PUD_UP = "PUD_UP"
+    PUD_DOWN = "PUD_DOWN"
+    HIGH = 1
+    LOW = 0
+    RISING = "RISING"
+    FALLING = "FALLING"
+    BOTH = "BOTH"
+
+    def __init__(self, reloj):
+        self.reloj = reloj
+        self._niveles = {}
+        self._detectores = {}  # pin -> (flanco, función, bouncetime en segundos)
+        self._ultimo_flanco = {}
+        self._lock = threading.Lock()
+        self.registro = []  # (instante, "entrada"/"salida", pin, valor)
+
+    def setwarnings(self, activar):
+        pass
+
+    def setmode(self, modo):
+        pass
+
+    def setup(self, pin, modo, pull_up_down=None, initial=None):
+        if modo == self.IN:
+            self._niveles.setdefault(pin, self.HIGH if pull_up_down == self.PUD_UP else self.LOW)
+        else:
+            self._niveles[pin] = initial if initial is not None else self.LOW
+
+    def input(self, pin):
+        return self._niveles.get(pin, self.LOW)
+
+    def output(self, pin, valor):
+        self._niveles[pin] = int(bool(valor))
+        self._registrar_salida(pin, int(bool(valor)))
+
+    def PWM(self, pin, frecuencia):
+        return PWMSimulado(self, pin, frecuencia)
+
+    def add_event_detect(self, pin, flanco, callback=None, bouncetime=0):
+        self._detectores[pin] = (flanco, callback, bouncetime / 1000.0)
+
+    def remove_event_detect(self, pin):
+        self._detectores.pop(pin, None)
+
+    def cleanup(self):
+        self._detectores.clear()
+
+    def _registrar_salida(self, pin, valor):
+        with self._lock:
+            self.registro.append((self.reloj.time(), "salida", pin, valor))
+
+    def fijar(self, pin, valor):
+        """
+        Cambia el nivel de una entrada y dispara su detector de flancos si procede.
+        """
+        anterior = self._niveles.get(pin, self.LOW)
+        self._niveles[pin] = valor
+        ahora = self.reloj.monotonic()
+        with self._lock:
+            self.registro.append((self.reloj.time(), "entrada", pin, valor))
+        if valor == anterior or pin not in self._detectores:
+            return
+        flanco, callback, bouncetime = self._detectores[pin]
+        if (flanco == self.RISING and not valor) or (flanco == self.FALLING and valor):
+            return
+        if ahora - self._ultimo_flanco.get(pin, float("-inf")) < bouncetime:
+            return
+        self._ultimo_flanco[pin] = ahora
+        if callback is not None:
+            threading.Thread(target=callback, args=(pin,), daemon=True).start()
+
+    def reproducir(self, cronograma, al_terminar=None):
+        """
+        Reproduce en un hilo una lista de pasos {"t": segundos, "pin": pin, "valor": 0/1}
+        ordenados por tiempo (en segundos del reloj desde el inicio).
+        """
+        def ejecutar():
+            inicio = self.reloj.monotonic()
+            for paso in sorted(cronograma, key=lambda p: p["t"]):
+                espera = paso["t"] - (self.reloj.monotonic() - inicio)
+                if espera > 0:
+                    self.reloj.sleep(espera)
+                self.fijar(paso["pin"], paso["valor"])
+            if al_terminar is not None:
+                al_terminar()
+
+        hilo = threading.Thread(target=ejecutar, daemon=True, name="cronograma")
+        hilo.start()
+        return hilo
+
+
+def cargar_cronograma(ruta, pines):
+    """
+    Lee un cronograma JSON. Cada paso puede indicar el pin por número o por
+    nombre ("presencia", "boton", "puerta"), que se traduce con `pines`.
+    """
+    with open(ruta) as archivo:
+        pasos = json.load(archivo)
+    for paso in pasos:
+        if isinstance(paso["pin"], str):
+            paso["pin"] = pines[paso["pin"]]
+    return pasos
+
+
+class CamaraSimulada:
+    """
+    Sustituto de Picamera2 que reproduce en bucle imágenes de una carpeta o un vídeo.
+    Entrega los fotogramas al ritmo `fps` del reloj y, si se configura, también un
+    flujo lores en YUV420 como la cámara real.
+    """
+
+    def __init__(self, fuente, reloj, fps=15):
+        self.reloj = reloj
+        self.fps = fps
+        self._config = None
+        self._fotogramas = []
+        self._video = None
+        self._indice = 0
+        self._ultimo = None
+        if fuente and os.path.isdir(fuente):
+            for ruta in sorted(glob.glob(os.path.join(fuente, "*"))):
+                imagen = cv2.imread(ruta)
+                if imagen is not None:
+                    self._fotogramas.append(imagen)
+        elif fuente:
+            self._video = cv2.VideoCapture(fuente)
+
+    def create_still_configuration(self, main=None, lores=None, **kwargs):
+        return {"main": main or {"size": (640, 480)}, "lores": lores}
+
+    def configure(self, config):
+        self._config = config
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        if self._video is not None:
+            self._video.release()
+
+    def _siguiente(self):
+        ancho, alto = self._config["main"]["size"]
+        if self._video is not None:
+            leido, imagen = self._video.read()
+            if not leido:
+                self._video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                leido, imagen = self._video.read()
+        elif self._fotogramas:
+            imagen = self._fotogramas[self._indice % len(self._fotogramas)]
+            self._indice += 1
+        else:
+            imagen = None
+        if imagen is None:
+            return np.zeros((alto, ancho, 3), dtype=np.uint8)
+        return cv2.resize(imagen, (ancho, alto))
+
+    def _esperar_fotograma(self):
+        ahora = self.reloj.monotonic()
+        if self._ultimo is not None:
+            espera = 1.0 / self.fps - (ahora - self._ultimo)
+            if espera > 0:
+                self.reloj.sleep(espera)
+        self._ultimo = self.reloj.monotonic()
+
+    def capture_array(self, name="main"):
+        self._esperar_fotograma()
+        return self._siguiente()
+
+    def capture_arrays(self, names=("main",)):
+        self._esperar_fotograma()
+        frame = self._siguiente()
+        arrays = []
+        for name in names:
+            if name == "lores":
+                ancho, alto = self._config["lores"]["size"]
+                arrays.append(cv2.cvtColor(cv2.resize(frame, (ancho, alto)), cv2.COLOR_BGR2YUV_I420))
+            else:
+                arrays.append(frame)
+        return arrays, {}
@@ -0,0 +1,271 @@
+import collections  # Estructuras de datos (deque para el orden de los fotogramas)
+import multiprocessing  # Biblioteca para crear y manejar procesos independientes
+from multiprocessing import shared_memory  # Memoria compartida entre procesos
+import queue  # Colas seguras entre hilos
+import signal  # Manejador de SIGTERM por defecto en los trabajadores
+import threading  # Manejo de hilos para tareas concurrentes
+import time  # Revisión periódica de los trabajadores
+import cv2  # Procesamiento de imágenes y captura de video
+import numpy as np  # Operaciones con arreglos y cálculos matemáticos
+import reconocimiento  # Detección y codificación de caras
+from captura import Metricas, Resultado, RESULTADO_VACIO
+from reloj import RelojReal
+
+
+def _trabajador(ranuras, forma, tareas, resultados, escala, upsample):
+    """
+    Proceso trabajador: detecta y codifica las caras del fotograma que hay en
+    la ranura de memoria compartida indicada. Solo viajan por la cola el número
+    de ranura, las cajas y las codificaciones, nunca el fotograma.
+    """
+    # Con fork se hereda el manejador de SIGTERM de caja.py; el trabajador debe terminar sin más
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    vistas = [np.ndarray(forma, dtype=np.uint8, buffer=ranura.buf) for ranura in ranuras]
+    reconocimiento.modelos()  # Cada trabajador carga los modelos al nacer, no con el primer fotograma
+    while True:
+        tarea = tareas.get()
+        if tarea is None:
+            break
+        seq, indice = tarea
+        try:
+            rgb_frame = cv2.cvtColor(vistas[indice], cv2.COLOR_BGR2RGB)
+            cajas = reconocimiento.detectar_caras(rgb_frame, escala, upsample)
+            face_encodings = reconocimiento.codificar_caras(rgb_frame, cajas)
+        except Exception as e:
+            print(f"Error en el trabajador de reconocimiento: {e}")
+            cajas, face_encodings = [], []
+        resultados.put((seq, indice, cajas, [np.asarray(e) for e in face_encodings]))
+
+
+class PoolReconocimiento:
+    """
+    Grupo de procesos que detectan y codifican caras en paralelo.
+    Los fotogramas se copian a ranuras de memoria compartida, así que no se
+    serializa ningún array de 640x480. Si no hay ranura libre el fotograma se descarta.
+
+    Debe crearse antes de arrancar la cámara y los hilos: los trabajadores se
+    crean con fork para no volver a importar (ni reconfigurar) el programa principal.
+    """
+
+    def __init__(self, num_trabajadores, forma, escala=1.0, upsample=1):
+        self._contexto = multiprocessing.get_context("fork")
+        self.num_trabajadores = num_trabajadores
+        self.forma = tuple(forma)
+        self.escala = escala
+        self.upsample = upsample
+        self.reinicios = 0
+        tamano = int(np.prod(self.forma))
+        self._ranuras = [shared_memory.SharedMemory(create=True, size=tamano) for _ in range(2 * num_trabajadores)]
+        self._vistas = [np.ndarray(self.forma, dtype=np.uint8, buffer=r.buf) for r in self._ranuras]
+        self._lock = threading.Lock()
+        self._crear_trabajadores()
+
+    def _crear_trabajadores(self):
+        """
+        Crea las colas y los procesos y deja todas las ranuras libres.
+        """
+        self._libres = queue.Queue()
+        for indice in range(len(self._ranuras)):
+            self._libres.put(indice)
+        self.tareas = self._contexto.Queue()
+        self.resultados = self._contexto.Queue()
+        self._procesos = [
+            self._contexto.Process(
+                target=_trabajador,
+                args=(self._ranuras, self.forma, self.tareas, self.resultados, self.escala, self.upsample),
+                daemon=True,
+            )
+            for _ in range(self.num_trabajadores)
+        ]
+        for proceso in self._procesos:
+            proceso.start()
+
+    def vivos(self):
+        """
+        Devuelve True si todos los trabajadores siguen vivos.
+        """
+        return all(proceso.is_alive() for proceso in self._procesos)
+
+    def reiniciar(self):
+        """
+        Sustituye todos los trabajadores y sus colas. Un trabajador muerto puede
+        haberse llevado una ranura y dejar bloqueada la cola de tareas, así que
+        no basta con reponerlo: se termina el resto y se empieza de cero.
+        Los resultados pendientes de los trabajadores anteriores se pierden.
+        """
+        with self._lock:
+            for proceso in self._procesos:
+                if proceso.is_alive():
+                    proceso.kill()  # SIGKILL: un trabajador colgado o parado no atiende a SIGTERM
+                proceso.join(timeout=2)
+            # Se crean con fork aunque ya haya hilos: los trabajadores solo usan sus colas y las ranuras
+            self._crear_trabajadores()
+            self.reinicios += 1
+        print(f"Pool de reconocimiento reiniciado ({self.reinicios} reinicios).")
+
+    def enviar(self, seq, frame):
+        """
+        Copia el fotograma a una ranura libre y lo encola. Devuelve False si no había ranura.
+        """
+        with self._lock:
+            try:
+                indice = self._libres.get_nowait()
+            except queue.Empty:
+                return False
+            np.copyto(self._vistas[indice], frame)
+            self.tareas.put((seq, indice))
+            return True
+
+    def recibir(self, timeout=None):
+        """
+        Espera el siguiente resultado (seq, cajas, codificaciones) y libera su ranura.
+        Devuelve None si no llega ninguno antes del timeout.
+        """
+        resultados, libres = self.resultados, self._libres
+        try:
+            seq, indice, cajas, face_encodings = resultados.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        libres.put(indice)
+        return seq, cajas, face_encodings
+
+    def detener(self):
+        for _ in self._procesos:
+            self.tareas.put(None)
+        for proceso in self._procesos:
+            proceso.join(timeout=2)
+            if proceso.is_alive():
+                proceso.kill()
+                proceso.join(timeout=2)
+        for ranura in self._ranuras:
+            ranura.close()
+            ranura.unlink()
+
+
+class EtapaPool(threading.Thread):
+    """
+    Equivalente a captura.EtapaReconocimiento usando un PoolReconocimiento.
+    Envía al pool los fotogramas más recientes mientras presencia esté activo y
+    publica los resultados en el orden de los fotogramas. Los resultados de
+    fotogramas con más de `caducidad` segundos se descartan, y un fotograma cuyo
+    resultado no llega en `plazo` segundos deja de esperarse para no bloquear a
+    los siguientes. Si muere un trabajador, o si pasa `plazo` sin que llegue
+    ningún resultado habiendo fotogramas pendientes (un trabajador colgado puede
+    bloquear la cola de tareas), el pool se reinicia. Cada envío
+    lleva la época de presencia en la que se hizo: al acabar la presencia se
+    descartan los resultados pendientes, que ya no deben encender el LED. Con una compuerta
+    (movimiento.CompuertaMovimiento) solo se envían los fotogramas con
+    movimiento y, entre envío y envío, se espera el intervalo que ella indique.
+    """
+
+    def __init__(self, captura, pool, galeria, presencia, caducidad=1.0, plazo=3.0, al_publicar=None, compuerta=None, reloj=None):
+        super().__init__(daemon=True, name="reconocimiento")
+        self.reloj = reloj or RelojReal()
+        self.captura = captura
+        self.pool = pool
+        self.galeria = galeria
+        self.presencia = presencia  # threading.Event activo mientras el PIR detecta a alguien
+        self.caducidad = caducidad
+        self.plazo = plazo
+        self.al_publicar = al_publicar
+        self.compuerta = compuerta
+        self.resultado = RESULTADO_VACIO
+        self.metricas = Metricas("procesos", self.reloj)
+        self.descartados = 0  # Fotogramas sin ranura libre, caducados o sin resultado a tiempo
+        self._lock = threading.Lock()
+        self._enviados = collections.deque()  # (seq, instante, enviado, época) en orden de envío
+        self._listos = {}
+        self._epoca = 0  # Aumenta cada vez que termina una presencia
+
+    def run(self):
+        threading.Thread(target=self._recibir_resultados, daemon=True, name="resultados_pool").start()
+        seq = -1
+        presente = False
+        while True:
+            if not self.presencia.is_set():
+                if presente:
+                    presente = False
+                    self.metricas.fin_presencia()
+                with self._lock:
+                    # Los resultados que lleguen de esta presencia ya no se publican
+                    self._epoca += 1
+                    self._enviados.clear()
+                    self._listos.clear()
+                    self._publicar(RESULTADO_VACIO)
+                self.presencia.wait()  # Dormir hasta el siguiente flanco del PIR
+                continue
+            if not presente:
+                presente = True
+                self.metricas.inicio_presencia()
+                if self.compuerta is not None:
+                    self.compuerta.inicio_presencia()
+            fotograma = self.captura.esperar_nuevo(seq)
+            if fotograma is None:
+                continue
+            seq = fotograma.seq
+            if self.compuerta is not None and not self.compuerta.debe_procesar(fotograma):
+                self.metricas.omitido()
+                continue
+            with self._lock:
+                self._enviados.append((fotograma.seq, fotograma.instante, self.reloj.monotonic(), self._epoca))
+                if not self.pool.enviar(fotograma.seq, fotograma.frame):
+                    self._enviados.pop()
+                    self.descartados += 1
+            if self.compuerta is not None:
+                self.reloj.sleep(self.compuerta.intervalo())
+
+    def _recibir_resultados(self):
+        revisado = time.monotonic()
+        ultimo_recibido = self.reloj.monotonic()
+        while True:
+            recibido = self.pool.recibir(timeout=self.reloj.a_real(min(self.plazo, 1.0)))
+            if recibido is not None:
+                ultimo_recibido = self.reloj.monotonic()
+            motivo = None
+            if time.monotonic() - revisado >= 1.0:
+                revisado = time.monotonic()
+                if not self.pool.vivos():
+                    motivo = "Un trabajador de reconocimiento ha muerto."
+            with self._lock:
+                # Ningún resultado desde que se envió el más antiguo pendiente: el pool no avanza
+                if motivo is None and self._enviados and self.reloj.monotonic() - self._enviados[0][2] > self.plazo \
+                        and ultimo_recibido < self._enviados[0][2]:
+                    motivo = "El pool de reconocimiento no responde."
+            if motivo is not None:
+                print(motivo)
+                self.pool.reiniciar()
+                ultimo_recibido = self.reloj.monotonic()
+                with self._lock:
+                    # Sus resultados no van a llegar
+                    self.descartados += len(self._enviados)
+                    self._enviados.clear()
+                    self._listos.clear()
+                continue
+            with self._lock:
+                if recibido is not None:
+                    seq, cajas, face_encodings = recibido
+                    if any(enviado[0] == seq for enviado in self._enviados):
+                        self._listos[seq] = face_encodings  # Si no, es de una presencia anterior o ya se dejó de esperar
+                # El primero pendiente no bloquea a los demás más de `plazo` segundos
+                while self._enviados and self._enviados[0][0] not in self._listos \
+                        and self.reloj.monotonic() - self._enviados[0][2] > self.plazo:
+                    self._enviados.popleft()
+                    self.descartados += 1
+                # Publicar en orden: solo cuando han terminado todos los fotogramas anteriores
+                while self._enviados and self._enviados[0][0] in self._listos:
+                    seq_listo, instante, _, epoca = self._enviados.popleft()
+                    encodings_listos = self._listos.pop(seq_listo)
+                    if epoca != self._epoca or self.reloj.time() - instante > self.caducidad:
+                        self.descartados += 1
+                        continue
+                    nombre, distancia = self.galeria.mejor_coincidencia(encodings_listos)
+                    if self.compuerta is not None:
+                        self.compuerta.resultado(nombre, len(encodings_listos))
+                    self.metricas.resultado()
+                    # Se publica con el lock: el fin de la presencia no puede colarse entre medias
+                    self._publicar(Resultado(seq_listo, instante, nombre, distancia))
+
+    def _publicar(self, resultado):
+        self.resultado = resultado
+        if self.al_publicar:
+            self.al_publicar(resultado)
@@ -1,25 +1,18 @@
-from flask import Flask, render_template, request, redirect, url_for, session
+from arranque import Cronometro
+# arranque: Mide la duración de cada fase del arranque (importaciones, base de datos, modelos).
+cronometro = Cronometro('web')
+
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_from_directory
 # Flask: Framework para crear aplicaciones web fácilmente.
 # render_template: Renderiza plantillas HTML.
 # request: Maneja solicitudes HTTP.
 # redirect, url_for: Facilitan redirecciones.
 # session: Permite manejar sesiones de usuario.
-
-import sqlite3
-# sqlite3: Base de datos ligera integrada en Python, utilizada aquí para almacenar usuarios.
-
-import face_recognition
-# face_recognition: Biblioteca para el reconocimiento facial. Permite analizar imágenes y extraer características únicas de rostros.
-
-import numpy as np
-# numpy: Biblioteca matemática para manejar matrices y operaciones numéricas.
+# jsonify: Respuestas JSON (estado de los trabajos de alta).
 
 import os
 # os: Proporciona funcionalidades del sistema operativo como manejo de archivos y directorios.
 
-from werkzeug.utils import secure_filename
-# secure_filename: Asegura que los nombres de archivos subidos sean seguros.
-
 from flask_bcrypt import Bcrypt
 # flask_bcrypt: Biblioteca para el manejo seguro de contraseñas mediante hashing.
 
@@ -34,6 +27,27 @@ from email.mime.text import MIMEText
 from dotenv import load_dotenv
 # dotenv: Carga variables de entorno desde un archivo .env.
 
+import basedatos
+# basedatos: Esquema de users.db (usuarios y sus muestras de codificación) y su migración.
+
+import instantanea
+# instantanea: Publica la galería en archivos que caja.py mapea en memoria sin decodificar la base de datos.
+
+import avisos
+# avisos: Avisa a caja.py de cada alta o baja por un socket Unix para que la aplique al momento.
+
+import altas
+# altas: Trabajos de alta en segundo plano; las caras se codifican en un pool de procesos.
+
+import historial
+# historial: Eventos de acceso registrados por caja.py (accesos, intrusiones y bloqueos).
+
+import capturas
+# capturas: Archivo en disco de las fotos de intrusiones y accesos que guarda caja.py.
+
+import time
+# time: Conversión entre fechas del formulario e instantes del historial.
+
 # Cargar las variables de entorno desde el archivo .env
 load_dotenv()
 
@@ -48,13 +62,51 @@ BOT_TOKEN = os.getenv('BOT_TOKEN')  # Token del bot de Telegram.
 CHAT_ID = os.getenv('CHAT_ID')  # ID del chat de Telegram para enviar notificaciones.
 
 bcrypt = Bcrypt(app)  # Inicializamos Bcrypt para manejar contraseñas de forma segura.
-UPLOAD_FOLDER = 'uploads'  # Carpeta donde se guardan los archivos subidos.
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}  # Extensiones permitidas para las imágenes.
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024  # Tamaño máximo de una subida (ZIP de altas masivas).
+USUARIOS_POR_PAGINA = 50  # Filas por página en el dashboard.
+EVENTOS_POR_PAGINA = 50  # Filas por página en el historial.
+CAPTURAS_POR_PAGINA = 24  # Miniaturas por página en la galería de capturas.
+PROCESOS_ALTAS = int(os.getenv('PROCESOS_ALTAS', '2'))  # Procesos que codifican las caras de las altas.
+
+# Servidor: waitress (un proceso con varios hilos) salvo con WEB_DESARROLLO=1.
+# Un solo proceso porque los trabajos de alta y su estado viven en memoria.
+WEB_DESARROLLO = os.getenv('WEB_DESARROLLO', '0') == '1'  # Servidor de desarrollo de Flask con recarga y depurador.
+HOST_WEB = os.getenv('HOST_WEB', '0.0.0.0')  # Dirección en la que escucha el servidor.
+PUERTO_WEB = int(os.getenv('PUERTO_WEB', '5000'))  # Puerto del servidor.
+HILOS_WEB = int(os.getenv('HILOS_WEB', '4'))  # Peticiones atendidas a la vez.
+COLA_WEB = int(os.getenv('COLA_WEB', '64'))  # Conexiones pendientes de aceptar (backlog del socket).
+CONEXIONES_WEB = int(os.getenv('CONEXIONES_WEB', '100'))  # Conexiones abiertas como máximo, incluidas las keep-alive.
+app.config['TEMPLATES_AUTO_RELOAD'] = WEB_DESARROLLO  # En producción las plantillas se compilan una vez.
+app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0 if WEB_DESARROLLO else 7 * 86400  # Caché de los archivos estáticos.
 
 # Credenciales de administrador
 ADMIN_USER = 'admin'  # Nombre de usuario del administrador.
-ADMIN_PASSWORD = bcrypt.generate_password_hash('admin').decode('utf-8')  # Contraseña encriptada.
+ADMIN_HASH_FILE = os.getenv('ADMIN_HASH_FILE', 'admin.hash')  # Archivo con el hash bcrypt de la contraseña.
+
+def cargar_hash_admin():
+    """
+    Devuelve el hash bcrypt de la contraseña del administrador: el de ADMIN_PASSWORD_HASH,
+    el guardado en ADMIN_HASH_FILE o, la primera vez, el de ADMIN_PASSWORD (por defecto
+    'admin'), que se guarda en ese archivo para no recalcularlo en cada arranque.
+    """
+    hash_guardado = os.getenv('ADMIN_PASSWORD_HASH')
+    if hash_guardado:
+        return hash_guardado
+    try:
+        with open(ADMIN_HASH_FILE) as archivo:
+            return archivo.read().strip()
+    except FileNotFoundError:
+        pass
+    hash_nuevo = bcrypt.generate_password_hash(os.getenv('ADMIN_PASSWORD', 'admin')).decode('utf-8')
+    try:
+        descriptor = os.open(ADMIN_HASH_FILE, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(descriptor, 'w') as archivo:
+            archivo.write(hash_nuevo)
+    except OSError as e:
+        print(f"No se pudo guardar el hash del administrador: {e}")
+    return hash_nuevo
+
+ADMIN_PASSWORD = None  # Contraseña encriptada; la carga inicializar().
 
 # Función para enviar mensajes a Telegram
 def send_telegram_message(message):
@@ -82,15 +134,47 @@ def send_email(to_email, subject, body):
 
 # Conexión a la base de datos SQLite
 def connect_db():
-    """Establece una conexión con la base de datos SQLite."""
-    conn = sqlite3.connect('users.db')
-    conn.row_factory = sqlite3.Row  # Devuelve filas como diccionarios.
-    return conn
+    """Devuelve la conexión de este hilo con la base de datos (WAL, reutilizada entre peticiones)."""
+    return basedatos.conectar()
+
+# Publica la galería para el proceso de reconocimiento
+def publicar_galeria(conn):
+    """Publica una instantánea nueva de la galería tras un alta o una baja."""
+    try:
+        instantanea.publicar(conn)
+    except Exception as e:
+        print(f"Error al publicar la instantánea de la galería: {e}")
 
 # Verifica si un archivo tiene una extensión permitida
 def allowed_file(filename):
     """Comprueba si el archivo tiene una extensión válida."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return altas.extension_valida(filename)
+
+# Notificaciones de cada alta, enviadas desde el hilo de los trabajos de alta
+def notificar_alta(unique_name, email, muestras):
+    """Avisa por Telegram y por correo de un usuario dado de alta."""
+    send_telegram_message(f"👤 Usuario registrado: {unique_name} ({muestras} muestras)")
+    send_email(email, "Confirmación de Registro", f"Hola {unique_name}, ha sido dado de alta en la aplicación. Ya puede acceder al contenido de la caja de seguridad.")
+
+gestor_altas = None  # altas.GestorAltas; lo crea inicializar().
+cronometro.marcar('importaciones')
+
+def inicializar():
+    """
+    Prepara todo lo que tiene efectos fuera del módulo: el hash del administrador,
+    las bases de datos, la instantánea y el gestor de altas. Importar web.py no
+    hace nada de esto, porque los procesos "spawn" del pool de altas lo vuelven a
+    importar como __mp_main__. El pool y sus modelos se cargan con la primera alta.
+    """
+    global ADMIN_PASSWORD, gestor_altas
+    ADMIN_PASSWORD = cargar_hash_admin()
+    gestor_altas = altas.GestorAltas(basedatos.RUTA, PROCESOS_ALTAS, al_registrar=notificar_alta)
+    conn = connect_db()
+    basedatos.preparar(conn)  # Crear las tablas o migrar una base de datos del esquema anterior.
+    publicar_galeria(conn)  # Partir de una instantánea que refleje la base de datos actual.
+    historial.preparar(basedatos.conectar(historial.RUTA))  # El historial puede consultarse antes de que caja.py escriba
+    cronometro.marcar('base de datos')
+    cronometro.informe()
 
 @app.route('/', methods=['GET', 'POST'])
 def login():
@@ -105,68 +189,76 @@ def login():
 
 @app.route('/dashboard')
 def dashboard():
-    """Muestra la lista de usuarios registrados."""
+    """Muestra los usuarios registrados por páginas, con búsqueda por prefijo de nombre o correo."""
     if not session.get('logged_in'):
         return redirect(url_for('login'))
+    q = request.args.get('q', '').strip()
+    despues_id = request.args.get('despues_id', type=int)
+    despues = (request.args.get('despues_nombre', ''), despues_id) if despues_id is not None else None
     conn = connect_db()
-    c = conn.cursor()
-    c.execute("SELECT name, email FROM users")  # Consulta todos los usuarios registrados.
-    users = c.fetchall()
-    conn.close()
-    return render_template('dashboard.html', users=users)
+    # Se pide una fila de más para saber si hay página siguiente
+    users = basedatos.buscar_usuarios(conn, q, despues, USUARIOS_POR_PAGINA + 1)
+    siguiente = None
+    if len(users) > USUARIOS_POR_PAGINA:
+        users = users[:USUARIOS_POR_PAGINA]
+        siguiente = url_for('dashboard', q=q or None, despues_nombre=users[-1]['name'], despues_id=users[-1]['id'])
+    return render_template('dashboard.html', users=users, q=q, siguiente=siguiente, paginado=despues is not None)
 
 @app.route('/add_user', methods=['GET', 'POST'])
 def add_user():
-    """Permite registrar un nuevo usuario con imagen."""
+    """Encola el alta de un usuario con una o varias imágenes (una muestra por imagen)."""
     if not session.get('logged_in'):
         return redirect(url_for('login'))
     if request.method == 'POST':
         name = request.form['name']
         email = request.form['email']
-        file = request.files['file']
-        if not name or not email or not file or not allowed_file(file.filename):
-            return redirect(url_for('add_user'))
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Cargar la imagen y obtener las codificaciones faciales
-        image = face_recognition.load_image_file(filepath)
-        face_encodings = face_recognition.face_encodings(image)
-        if not face_encodings:
+        # Las imágenes se leen en memoria: no se guardan en disco
+        imagenes = [f.read() for f in request.files.getlist('file') if f and allowed_file(f.filename)]
+        if not name or not email or not imagenes:
             return redirect(url_for('add_user'))
+        id_trabajo = gestor_altas.alta(name, email, imagenes)
+        return redirect(url_for('add_user', trabajo=id_trabajo))
+    return render_template('add_user.html', trabajo=request.args.get('trabajo'), listo=gestor_altas.listo.is_set())
+
+@app.route('/bulk_add_users', methods=['POST'])
+def bulk_add_users():
+    """
+    Encola el alta de varias personas a la vez: un ZIP con una carpeta por persona
+    (o imágenes `nombre_1.jpg`, `nombre_2.jpg`...) y un `personas.csv` con `nombre,email`,
+    o varias imágenes sueltas con esas líneas en el campo de texto `personas`.
+    """
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    correos = altas.leer_correos(request.form.get('personas', ''))
+    archivo_zip = request.files.get('zip')
+    try:
+        if archivo_zip and archivo_zip.filename.lower().endswith('.zip'):
+            personas = altas.leer_zip(archivo_zip.read(), correos)
         else:
-            encoding = face_encodings[0]
-            conn = connect_db()
-            c = conn.cursor()
-            # Verificar si el correo ya está registrado
-            c.execute("SELECT name FROM users WHERE email = ?", (email,))
-            if c.fetchone():
-                conn.close()
-                os.remove(filepath)
-                return redirect(url_for('add_user'))
-
-            unique_name = name
-            counter = 1
-            while True:
-                # Verificar si el nombre es único
-                c.execute("SELECT name FROM users WHERE name = ?", (unique_name,))
-                if not c.fetchone():
-                    break
-                unique_name = f"{name}_{str(counter).zfill(3)}"
-                counter += 1
-            try:
-                # Insertar el usuario en la base de datos
-                c.execute("INSERT INTO users (name, email, encoding) VALUES (?, ?, ?)", (unique_name, email, encoding.tobytes()))
-                conn.commit()
-                # Enviar notificaciones
-                send_telegram_message(f"👤 Usuario registrado: {unique_name}")
-                send_email(email, "Confirmación de Registro", f"Hola {unique_name}, ha sido dado de alta en la aplicación. Ya puede acceder al contenido de la caja de seguridad.")
-            finally:
-                conn.close()
-        os.remove(filepath)
+            archivos = [(f.filename, f.read()) for f in request.files.getlist('file') if f and allowed_file(f.filename)]
+            personas = altas.agrupar(archivos, correos)
+    except Exception as e:
+        print(f"Error al leer el alta masiva: {e}")
         return redirect(url_for('add_user'))
-    return render_template('add_user.html')
+    if not personas:
+        return redirect(url_for('add_user'))
+    id_trabajo = gestor_altas.lote(personas)
+    return redirect(url_for('add_user', trabajo=id_trabajo))
+
+@app.route('/jobs/<id_trabajo>')
+def job_status(id_trabajo):
+    """Devuelve en JSON el estado de un trabajo de alta."""
+    if not session.get('logged_in'):
+        return jsonify({"message": "No autorizado"}), 401
+    estado = gestor_altas.estado(id_trabajo)
+    if estado is None:
+        return jsonify({"message": "Trabajo no encontrado"}), 404
+    return jsonify(estado)
+
+@app.route('/salud')
+def health():
+    """Estado del servidor en JSON: si los modelos de las altas están cargados y cuánto tardó el arranque."""
+    return jsonify({"listo": gestor_altas.listo.is_set(), "arranque": cronometro.como_dict()})
 
 @app.route('/delete_user_confirm', methods=['POST'])
 def delete_user_confirm():
@@ -182,13 +274,13 @@ def delete_user_confirm():
         c.execute("SELECT email FROM users WHERE name = ?", (username,))
         user = c.fetchone()
         if not user:
-            conn.close()
             return redirect(url_for('dashboard'))
         
         email = user['email']
-        c.execute("DELETE FROM users WHERE name = ?", (username,))
+        basedatos.eliminar_usuario(conn, username)
         conn.commit()
-        conn.close()
+        publicar_galeria(conn)
+        avisos.enviar(avisos.BAJA, username)  # Revocación inmediata en caja.py
 
         # Enviar notificaciones
         send_telegram_message(f"❌ Usuario eliminado: {username}")
@@ -197,20 +289,92 @@ def delete_user_confirm():
     else:
         return redirect(url_for('dashboard'))
 
+@app.template_filter('fecha')
+def fecha(instante):
+    """Formatea un instante del historial como fecha y hora locales."""
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(instante))
+
+def dia_a_instante(texto, dias=0):
+    """Convierte una fecha AAAA-MM-DD del formulario en el instante de su comienzo (más `dias`)."""
+    if not texto:
+        return None
+    try:
+        return time.mktime(time.strptime(texto, '%Y-%m-%d')) + dias * 86400
+    except ValueError:
+        return None
+
+@app.route('/historial')
+def history():
+    """Muestra el historial de eventos por páginas, filtrable por tipo, usuario y fechas."""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    filtros = {
+        'tipo': request.args.get('tipo') or None,
+        'usuario': request.args.get('usuario', '').strip() or None,
+        'desde': request.args.get('desde') or None,
+        'hasta': request.args.get('hasta') or None,
+    }
+    antes_id = request.args.get('antes_id', type=int)
+    antes_de = (request.args.get('antes_instante', type=float), antes_id) if antes_id is not None else None
+    conn = basedatos.conectar(historial.RUTA)
+    eventos = historial.consultar(
+        conn, filtros['tipo'], filtros['usuario'],
+        dia_a_instante(filtros['desde']), dia_a_instante(filtros['hasta'], dias=1),  # "hasta" incluye ese día
+        antes_de, EVENTOS_POR_PAGINA + 1,
+    )
+    siguiente = None
+    if len(eventos) > EVENTOS_POR_PAGINA:
+        eventos = eventos[:EVENTOS_POR_PAGINA]
+        siguiente = url_for('history', **{k: v for k, v in filtros.items() if v},
+                            antes_instante=eventos[-1]['instante'], antes_id=eventos[-1]['id'])
+    return render_template('historial.html', eventos=eventos, filtros=filtros, tipos=historial.TIPOS,
+                           siguiente=siguiente, paginado=antes_de is not None)
+
+@app.route('/capturas')
+def captures():
+    """Muestra las miniaturas de las capturas guardadas por caja.py, de la más reciente a la más antigua."""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    antes = request.args.get('antes') or None
+    referencias = capturas.listar(antes_de=antes, limite=CAPTURAS_POR_PAGINA + 1)
+    siguiente = None
+    if len(referencias) > CAPTURAS_POR_PAGINA:
+        referencias = referencias[:CAPTURAS_POR_PAGINA]
+        siguiente = url_for('captures', antes=referencias[-1])
+    return render_template('capturas.html', referencias=referencias, siguiente=siguiente, paginado=antes is not None)
+
+@app.route('/capturas/<referencia>')
+def capture_image(referencia):
+    """Devuelve una captura en JPEG, o su miniatura con ?miniatura=1."""
+    if not session.get('logged_in'):
+        return redirect(url_for('login'))
+    miniatura = request.args.get('miniatura') == '1'
+    # send_from_directory rechaza las rutas que salen del directorio de capturas
+    nombre = os.path.basename(capturas.ruta_captura(referencia, miniatura))
+    return send_from_directory(os.path.abspath(capturas.DIRECTORIO), nombre, max_age=86400)  # Las capturas no cambian
+
 @app.route('/logout')
 def logout():
     """Cierra la sesión del administrador."""
     session['logged_in'] = False
     return redirect(url_for('login'))
 
+def servir():
+    """
+    Sirve la aplicación ya cargada con waitress: HILOS_WEB hilos, keep-alive y
+    colas acotadas. Las peticiones que no caben esperan en el backlog del socket.
+    """
+    from waitress import serve  # Solo hace falta en producción
+
+    serve(
+        app, host=HOST_WEB, port=PUERTO_WEB, threads=HILOS_WEB, backlog=COLA_WEB,
+        connection_limit=CONEXIONES_WEB, channel_timeout=120, ident='AccesoSeguro',
+    )
+
 if __name__ == '__main__':
     # Configuración inicial para base de datos y directorios
-    if not os.path.exists('users.db'):
-        conn = connect_db()
-        c = conn.cursor()
-        c.execute("CREATE TABLE users (name TEXT UNIQUE, email TEXT, encoding BLOB)")  # Crear tabla para usuarios.
-        conn.commit()
-        conn.close()
-    if not os.path.exists(UPLOAD_FOLDER):
-        os.makedirs(UPLOAD_FOLDER)  # Crear directorio para subir archivos si no existe.
-    app.run(debug=True, host='0.0.0.0', port=5000)  # Iniciar la aplicación en modo depuración.
+    inicializar()
+    if WEB_DESARROLLO:
+        app.run(debug=True, host=HOST_WEB, port=PUERTO_WEB)  # Iniciar la aplicación en modo depuración.
+    else:
+        servir()
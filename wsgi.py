@@ -0,0 +1,7 @@
+# Punto de entrada WSGI para servir web.py con otro servidor, por ejemplo:
+#   gunicorn wsgi:app --workers 1 --threads 4 --backlog 64 --keep-alive 5
+# La aplicación se prepara al importar este módulo, una sola vez por proceso.
+# Debe usarse un único proceso: los trabajos de alta y su estado viven en memoria.
+from web import app, inicializar
+
+inicializar()